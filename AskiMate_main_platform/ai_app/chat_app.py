@@ -1,48 +1,305 @@
+import time
+_import_started = time.perf_counter()
+
+import asyncio
 from fastapi import FastAPI
-from contextlib import asynccontextmanager
-from rasa.core.agent import Agent
-import boto3
-import yaml
+from fastapi.responses import JSONResponse, StreamingResponse
+from contextlib import asynccontextmanager, contextmanager
 import json
+import os
+import re
 from pydantic import BaseModel
 import uuid
-from langdetect import detect
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+from stage_graph import StageGraph
+from fair_scheduler import FairScheduler, Overloaded
+from prompt_cache import PrefixReuseTracker, converse_request, supports_cache_points
+
+# rasa, boto3, yaml and langdetect are imported where first used: rasa alone takes seconds to
+# import, and it must only be imported in the worker, after gunicorn forks (see gunicorn.conf.py).
+
+MODEL_PATH = os.getenv("RASA_MODEL_PATH", "models/20250724-114045-optimal-level.tar.gz")
+
+# -----------------------------
+# Startup time breakdown (ms), reported by /metrics
+startup_timings = {}
+
+
+@contextmanager
+def startup_timer(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = round((time.perf_counter() - started) * 1000, 1)
+        print(f"[DEBUG] startup: {name} took {startup_timings[name]} ms")
 
 # -----------------------------
 # Load config
-with open("config.yml", "r") as config_file:
-    config = yaml.safe_load(config_file)
+@lru_cache(maxsize=None)
+def get_config() -> dict:
+    with startup_timer("load_config"):
+        import yaml
+        with open("config.yml", "r") as config_file:
+            return yaml.safe_load(config_file)
 
 # -----------------------------
-# AWS Bedrock client setup - rely on container AWS credentials
-bedrock_client = boto3.client(
-    service_name='bedrock-runtime',
-    region_name='us-east-1'  # ثابت نگه می‌داریم
-)
+# AWS Bedrock client setup - rely on container AWS credentials.
+# Created lazily per process: boto3 clients must not be shared across a fork.
+_bedrock_client = None
+
+
+def get_bedrock_client():
+    global _bedrock_client
+    if _bedrock_client is None and os.getenv("BEDROCK_FAKE"):
+        # local runs: simulated Bedrock with prompt-cache pricing/latency (fake_bedrock.py)
+        from fake_bedrock import FakeBedrockClient
+        _bedrock_client = FakeBedrockClient(**get_config().get('PromptCache', {}).get('fake', {}))
+    if _bedrock_client is None:
+        with startup_timer("bedrock_client"):
+            import boto3
+            _bedrock_client = boto3.client(
+                service_name='bedrock-runtime',
+                region_name='us-east-1'  # ثابت نگه می‌داریم
+            )
+    return _bedrock_client
 
 # -----------------------------
-def detect_language(text: str) -> str:
+# Rasa agent: loaded once per worker process (post_worker_init in gunicorn.conf.py, or lifespan).
+_agent = None
+
+
+def load_agent():
+    global _agent
+    if _agent is None:
+        with startup_timer("import_rasa"):
+            from rasa.core.agent import Agent
+        with startup_timer("load_agent"):
+            _agent = Agent.load(MODEL_PATH)
+    return _agent
+
+# -----------------------------
+# Model routing: each task gets a profile from config['Models'], falling back
+# to the single config['AWS']['model_id'] if no profile is configured.
+def default_profile() -> dict:
+    return {
+        "model_ids": [get_config()['AWS']['model_id']],
+        "min_gen_len": 500,
+        "gen_len_per_char": 0,
+        "max_gen_len": 500,
+        "temperature": 0.7,
+        "top_p": 0.9,
+    }
+
+
+def select_model_profile(task: str, input_text: str = "") -> dict:
+    """
+    Return the generation settings for a task ("translation", "short_reply", "generation").
+    max_gen_len is scaled to the input length so short inputs get a small budget.
+    """
+    profile = {**default_profile(), **get_config().get('Models', {}).get(task, {})}
+    scaled = profile["min_gen_len"] + int(len(input_text or "") * profile["gen_len_per_char"])
+    profile["max_gen_len"] = max(1, min(scaled, profile["max_gen_len"]))
+    return profile
+
+
+def route_generation_task(user_message: str, context: str) -> str:
+    """Pick the cheaper "short_reply" profile when both the question and the Rasa context are short."""
+    limit = get_config().get('Routing', {}).get('short_reply_max_chars', 0)
+    if len(user_message or "") <= limit and len(context or "") <= limit:
+        return "short_reply"
+    return "generation"
+
+
+def prompt_cache_config() -> dict:
+    return get_config().get('PromptCache', {})
+
+
+@lru_cache(maxsize=1)
+def get_prefix_tracker() -> PrefixReuseTracker:
+    return PrefixReuseTracker(cached_input_discount=prompt_cache_config().get('cached_input_discount', 0.9))
+
+
+def invoke_usage(response) -> dict:
+    """
+    Token usage from InvokeModel's response headers. The input count is always reported; the cache
+    read count only by models with prompt caching, otherwise cacheReadInputTokens is None.
+    """
+    headers = response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+    cache_read = headers.get('x-amzn-bedrock-cache-read-input-token-count')
+    return {
+        "inputTokens": int(headers.get('x-amzn-bedrock-input-token-count', 0)) or None,
+        "cacheReadInputTokens": int(cache_read) if cache_read is not None else None,
+    }
+
+
+def use_converse(model_id: str, conversation) -> bool:
+    return conversation is not None and supports_cache_points(model_id, prompt_cache_config())
+
+
+def converse_args(model_id: str, profile: dict, conversation) -> dict:
+    return {
+        "modelId": model_id,
+        **converse_request(*conversation, cache_points=True),
+        "inferenceConfig": {
+            "maxTokens": profile["max_gen_len"],
+            "temperature": profile["temperature"],
+            "topP": profile["top_p"],
+        },
+    }
+
+
+def invoke_llama(task: str, prompt: str, input_text: str = "", conversation=None, session_id: str = None) -> str:
+    """
+    Invoke Bedrock with the profile for `task`, trying each model id in order.
+    `conversation` is (system_message, history, user_message) for chat turns: models listed in
+    PromptCache.cache_point_models get it through the Converse API with cache points, the others
+    get the rendered `prompt`. Prefix reuse is recorded per session_id.
+    Raises the last error if every model fails.
     """
-    Detect the language of the given text and return a string.
-    - Returns "English" if detected as English.
-    - For very short texts (<5 chars), defaults to "English" to avoid langdetect misfires.
-    - On error, returns "Unknown".
+    profile = select_model_profile(task, input_text)
+    request_body = {
+        "prompt": prompt,
+        "max_gen_len": profile["max_gen_len"],
+        "temperature": profile["temperature"],
+        "top_p": profile["top_p"]
+    }
+    last_error = None
+    for model_id in profile["model_ids"]:
+        try:
+            if use_converse(model_id, conversation):
+                response = get_bedrock_client().converse(**converse_args(model_id, profile, conversation))
+                text = response['output']['message']['content'][0].get('text', '')
+                usage = response.get('usage')
+            else:
+                response = get_bedrock_client().invoke_model(
+                    modelId=model_id,
+                    body=json.dumps(request_body),
+                    contentType='application/json',
+                    accept='application/json'
+                )
+                text = json.loads(response['body'].read()).get('generation', '')
+                usage = invoke_usage(response)
+            print(f"[DEBUG] {task} served by {model_id} (max_gen_len={profile['max_gen_len']})")
+            if session_id:
+                get_prefix_tracker().record(session_id, prompt, usage)
+            return text
+        except Exception as e:
+            print(f"[ERROR] {task} model {model_id} failed: {e}")
+            last_error = e
+    raise last_error or RuntimeError(f"No model configured for {task}")
+
+
+async def stream_llama(task: str, prompt: str, input_text: str = "", conversation=None, session_id: str = None):
+    """
+    Streaming counterpart of invoke_llama: yields generated text chunks as Bedrock produces them.
+    Falls back to the next model id only if a model fails before its first chunk.
+    """
+    profile = select_model_profile(task, input_text)
+    request_body = {
+        "prompt": prompt,
+        "max_gen_len": profile["max_gen_len"],
+        "temperature": profile["temperature"],
+        "top_p": profile["top_p"]
+    }
+    last_error = None
+    for model_id in profile["model_ids"]:
+        converse = use_converse(model_id, conversation)
+        try:
+            if converse:
+                response = await asyncio.to_thread(
+                    get_bedrock_client().converse_stream, **converse_args(model_id, profile, conversation)
+                )
+            else:
+                response = await asyncio.to_thread(
+                    get_bedrock_client().invoke_model_with_response_stream,
+                    modelId=model_id,
+                    body=json.dumps(request_body),
+                    contentType='application/json',
+                    accept='application/json'
+                )
+        except Exception as e:
+            print(f"[ERROR] {task} stream model {model_id} failed: {e}")
+            last_error = e
+            continue
+        usage = None if converse else invoke_usage(response)
+        events = iter(response['stream'] if converse else response['body'])
+        # boto3's event stream is blocking, read it off the event loop
+        while (event := await asyncio.to_thread(next, events, None)) is not None:
+            if converse:
+                chunk = event.get('contentBlockDelta', {}).get('delta', {}).get('text', '')
+                usage = event.get('metadata', {}).get('usage', usage)
+            else:
+                chunk = json.loads(event['chunk']['bytes']).get('generation', '')
+            if chunk:
+                yield chunk
+        if session_id:
+            get_prefix_tracker().record(session_id, prompt, usage)
+        return
+    raise last_error or RuntimeError(f"No model configured for {task}")
+
+# -----------------------------
+def detect_language_with_confidence(text: str) -> tuple:
+    """
+    Detect the language of the given text. Returns (language, probability):
+    - "English" if detected as English, otherwise the langdetect code.
+    - For very short texts (<5 chars), ("English", 0.0) to avoid langdetect misfires.
+    - On error, ("Unknown", 0.0).
     """
     try:
         if not isinstance(text, str) or not text.strip():
-            return "Unknown"
+            return "Unknown", 0.0
 
         if len(text.strip()) < 5:
             print(f"[DEBUG] Short text detected ('{text}'), defaulting language to English")
-            return "English"
+            return "English", 0.0
 
-        lang_code = detect(text)
-        if lang_code == "en":
-            return "English"
-        return lang_code
+        from langdetect import detect_langs
+        best = detect_langs(text)[0]
+        if best.lang == "en":
+            return "English", best.prob
+        return best.lang, best.prob
     except Exception as e:
         print(f"[ERROR] Language detection failed: {e}")
-        return "Unknown"
+        return "Unknown", 0.0
+
+
+def detect_language(text: str) -> str:
+    return detect_language_with_confidence(text)[0]
+
+
+def hint_is_plausible(hint: str, text: str) -> bool:
+    """
+    Cheap check that a session language hint still fits the message: an English hint with a
+    mostly non-Latin message (or the reverse) means the user switched language, so the hint is
+    ignored and detection decides.
+    """
+    letters = [c for c in text if c.isalpha()]
+    if len(letters) < 5:
+        return True
+    latin = sum(1 for c in letters if c < "\u0250") / len(letters)
+    if is_english(hint):
+        return latin > 0.5
+    if hint in LATIN_SCRIPT_LANGUAGES:
+        return True
+    return latin < 0.5
+
+
+def detection_overrides_hint(text: str, confidence: float) -> bool:
+    """A detection replaces the session hint only when it is confident and the text is long enough to trust it."""
+    language = get_config().get('Language', {})
+    return (
+        confidence >= language.get('hint_override_confidence', 0.95)
+        and sum(1 for c in text if c.isalpha()) >= language.get('hint_override_min_letters', 15)
+    )
+
+
+# langdetect codes written in Latin script; for these a hint can't be checked by script alone
+LATIN_SCRIPT_LANGUAGES = {
+    "af", "ca", "cs", "cy", "da", "de", "es", "et", "fi", "fr", "hr", "hu", "id", "it", "lt", "lv",
+    "nl", "no", "pl", "pt", "ro", "sk", "sl", "so", "sq", "sv", "sw", "tl", "tr", "vi",
+}
 
 # -----------------------------
 def translate_to_english(text, source_language):
@@ -51,20 +308,7 @@ def translate_to_english(text, source_language):
         return text
     prompt = f"""<|begin_of_text|>..."""
     try:
-        request_body = {
-            "prompt": prompt,
-            "max_gen_len": 500,
-            "temperature": 0.2,
-            "top_p": 0.9
-        }
-        response = bedrock_client.invoke_model(
-            modelId=config['AWS']['model_id'],
-            body=json.dumps(request_body),
-            contentType='application/json',
-            accept='application/json'
-        )
-        response_body = json.loads(response['body'].read())
-        return response_body.get('generation', text).strip()
+        return invoke_llama("translation", prompt, text).strip() or text
     except Exception as e:
         print(f"[ERROR] translation to English failed: {e}")
         return text
@@ -75,24 +319,32 @@ def translate_from_english(text, target_language):
         return text
     prompt = f"""<|begin_of_text|>..."""
     try:
-        request_body = {
-            "prompt": prompt,
-            "max_gen_len": 500,
-            "temperature": 0.2,
-            "top_p": 0.9
-        }
-        response = bedrock_client.invoke_model(
-            modelId=config['AWS']['model_id'],
-            body=json.dumps(request_body),
-            contentType='application/json',
-            accept='application/json'
-        )
-        response_body = json.loads(response['body'].read())
-        return response_body.get('generation', text).strip()
+        return invoke_llama("translation", prompt, text).strip() or text
     except Exception as e:
         print(f"[ERROR] translation from English failed: {e}")
         return text
 
+_translation_cache = OrderedDict()
+
+
+def translate_from_english_cached(text, target_language):
+    """
+    translate_from_english with an LRU cache, used for canned Rasa answers that repeat verbatim.
+    Failed translations (the text comes back unchanged) are not cached.
+    """
+    if isinstance(target_language, str) and target_language.lower() == "english":
+        return text
+    key = (text, target_language)
+    if key in _translation_cache:
+        _translation_cache.move_to_end(key)
+        return _translation_cache[key]
+    translated = translate_from_english(text, target_language)
+    if translated != text:
+        _translation_cache[key] = translated
+        if len(_translation_cache) > get_config().get('FastPath', {}).get('translation_cache_size', 1024):
+            _translation_cache.popitem(last=False)
+    return translated
+
 # -----------------------------
 def format_llama_prompt(system_message, user_message, chat_history):
     prompt = "<|begin_of_text|><|start_header_id|>system<|end_header_id|>\n\n"
@@ -108,10 +360,42 @@ def format_llama_prompt(system_message, user_message, chat_history):
     prompt += f"<|start_header_id|>user<|end_header_id|>\n\n{user_message}<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n"
     return prompt
 
+# -----------------------------
+def load_verbatim_responses(agent) -> set:
+    """Collect the texts of domain responses marked `metadata: {verbatim: true}`."""
+    domain_responses = getattr(agent.domain, "responses", None) or getattr(agent.domain, "templates", {})
+    verbatim = set()
+    for variations in domain_responses.values():
+        for variation in variations:
+            if (variation.get("metadata") or {}).get("verbatim") and variation.get("text"):
+                verbatim.add(variation["text"].strip())
+    return verbatim
+
+
+async def get_intent_confidence(agent, session_id: str) -> float:
+    """Confidence of the intent Rasa predicted for the latest user message in this conversation."""
+    try:
+        tracker = await agent.processor.get_tracker(session_id)
+        return float(tracker.latest_message.intent.get("confidence") or 0.0)
+    except Exception as e:
+        print(f"[ERROR] Could not read intent confidence: {e}")
+        return 0.0
+
+
+def is_fast_path_answer(answer: str, confidence: float) -> bool:
+    fast_path = get_config().get('FastPath', {})
+    if not fast_path.get('enabled', False) or not answer:
+        return False
+    return confidence >= fast_path.get('min_intent_confidence', 1.0) and answer.strip() in app.state.verbatim_responses
+
 # -----------------------------
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    app.state.agent = Agent.load("models/20250724-114045-optimal-level.tar.gz")
+    with startup_timer("lifespan"):
+        app.state.agent = load_agent()
+        get_bedrock_client()
+    app.state.verbatim_responses = load_verbatim_responses(app.state.agent)
+    print(f"[DEBUG] {len(app.state.verbatim_responses)} verbatim responses eligible for the fast path")
     yield
 
 app = FastAPI(lifespan=lifespan)
@@ -121,6 +405,91 @@ app = FastAPI(lifespan=lifespan)
 def health():
     return {"status": "ok"}
 
+
+# Bedrock reachability is checked with a 1-token generation, at most once per interval.
+_bedrock_check = {"ok": False, "checked_at": 0.0, "error": None}
+
+
+def check_bedrock() -> dict:
+    interval = get_config().get('Readiness', {}).get('bedrock_check_interval', 300)
+    # a failed check is retried on every call so readiness flips as soon as Bedrock answers
+    if not _bedrock_check["ok"] or time.monotonic() - _bedrock_check["checked_at"] >= interval:
+        model_id = select_model_profile("translation")["model_ids"][0]
+        try:
+            get_bedrock_client().invoke_model(
+                modelId=model_id,
+                body=json.dumps({"prompt": "<|begin_of_text|>ping", "max_gen_len": 1}),
+                contentType='application/json',
+                accept='application/json'
+            )
+            _bedrock_check.update(ok=True, error=None)
+        except Exception as e:
+            print(f"[ERROR] Bedrock readiness check failed: {e}")
+            _bedrock_check.update(ok=False, error=str(e))
+        _bedrock_check["checked_at"] = time.monotonic()
+    return {"ok": _bedrock_check["ok"], "error": _bedrock_check["error"]}
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness, unlike /health: the Rasa agent is loaded, Bedrock answers and caches are warm.
+    Returns 503 until ready, so the platform's warm-up ping doubles as a wake-up call.
+    """
+    agent_loaded = getattr(app.state, "agent", None) is not None
+    bedrock = await asyncio.to_thread(check_bedrock)
+    status = {
+        "ready": agent_loaded and bedrock["ok"],
+        "agent_loaded": agent_loaded,
+        "bedrock": bedrock,
+        "caches": {
+            "verbatim_responses": len(getattr(app.state, "verbatim_responses", ())),
+            "translation_cache": len(_translation_cache),
+        },
+        "startup_ms": startup_timings,
+    }
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+# -----------------------------
+# Share of traffic served straight from Rasa without a Llama generation.
+fast_path_stats = {"total": 0, "fast_path": 0}
+# Turns whose language came from the platform's session hint or from detection; hint_overridden
+# counts hinted turns where a confident detection disagreed and replaced the hint.
+language_source_stats = {"hint": 0, "detected": 0, "hint_overridden": 0}
+# Per-stage wall time of the pipeline, for comparing pipeline settings across deployments.
+stage_timing_stats = defaultdict(lambda: {"count": 0, "total_ms": 0.0})
+
+
+def record_stage_timings(timings: dict):
+    for stage, elapsed_ms in timings.items():
+        stage_timing_stats[stage]["count"] += 1
+        stage_timing_stats[stage]["total_ms"] += elapsed_ms
+
+
+@app.get("/metrics")
+def metrics():
+    total = fast_path_stats["total"]
+    return {
+        **fast_path_stats,
+        "fast_path_ratio": fast_path_stats["fast_path"] / total if total else 0.0,
+        "pipeline": get_config().get('Pipeline', {}),
+        "language_source": language_source_stats,
+        "startup_ms": startup_timings,
+        "scheduler": get_scheduler().stats(),
+        "prompt_cache": get_prefix_tracker().stats(),
+        "stage_avg_ms": {
+            stage: round(stats["total_ms"] / stats["count"], 1)
+            for stage, stats in stage_timing_stats.items()
+        },
+        # simulated cost/latency with and without the prompt cache (BEDROCK_FAKE=1 only)
+        "fake_bedrock": _bedrock_client.stats() if hasattr(_bedrock_client, "stats") else None,
+    }
+
+
+@app.get("/metrics/prompt-cache/{session_id}")
+def session_prompt_cache_metrics(session_id: str):
+    return get_prefix_tracker().stats(session_id)
+
 # -----------------------------
 sessions = {}
 
@@ -128,59 +497,353 @@ class ChatRequest(BaseModel):
     session_id: str = None
     message: str
     history: list[dict] = []
+    # session language the platform learned from earlier turns; used for the turn unless langdetect
+    # (which still runs) confidently disagrees, see prepare_turn
+    language_hint: str = None
+
+# Single-flight: concurrent identical (session_id, message) requests, on /chat/ or /chat/stream,
+# share one pipeline run. Values are awaitables that resolve to the turn_response.
+_inflight = {}
+
+
+@lru_cache(maxsize=1)
+def get_scheduler() -> FairScheduler:
+    return FairScheduler(**get_config().get('Scheduler', {}))
+
+
+def too_many_requests(e: Overloaded) -> JSONResponse:
+    return JSONResponse(
+        {"error": e.reason, "retry_after": e.retry_after},
+        status_code=429,
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+async def scheduled_pipeline(session_id: str, request: ChatRequest):
+    async with get_scheduler().slot(session_id):
+        return await run_chat_pipeline(session_id, request)
+
 
 @app.post("/chat/")
 async def chat_endpoint(request: ChatRequest):
     session_id = request.session_id or str(uuid.uuid4())
-    message = request.message
-    chat_history = request.history
+    key = (session_id, request.message)
+    task = _inflight.get(key)
+    if task is None:
+        try:
+            get_scheduler().check(session_id)
+        except Overloaded as e:
+            return too_many_requests(e)
+        task = asyncio.ensure_future(scheduled_pipeline(session_id, request))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        print(f"[DEBUG] coalescing duplicate request for session {session_id}\n")
+    # shield: a disconnecting duplicate must not cancel the shared run
+    try:
+        return await asyncio.shield(task)
+    except Overloaded as e:
+        return too_many_requests(e)
+    except asyncio.CancelledError:
+        if not task.cancelled():
+            raise
+        # joined a /chat/stream run whose client went away before the reply: run this one itself
+        return await chat_endpoint(request)
+
 
-    user_language = detect_language(message)
-    print(f"[DEBUG] Detected user_language={user_language} ({type(user_language)})\n")
+def is_english(language) -> bool:
+    return not (isinstance(language, str) and language.lower() != "english")
 
+
+def pipeline_option(name: str) -> bool:
+    return bool(get_config().get('Pipeline', {}).get(name, False))
+
+
+def turn_response(turn: dict, answer: str) -> dict:
+    return {
+        "session_id": turn["session_id"],
+        "answer": answer,
+        "detected_language": turn["user_language"],
+        "language_confidence": turn["language_confidence"],
+        "language_source": turn["language_source"],
+        "original_message": turn["message"],
+        "translated_message": None if is_english(turn["user_language"]) else turn["english_message"],
+        "stage_timings_ms": {stage: round(ms, 1) for stage, ms in turn["timings"].items()}
+    }
+
+
+async def prepare_turn(session_id: str, request: ChatRequest) -> dict:
+    """
+    Everything before generation: language detection, translation to English, Rasa and the fast path.
+    `fast_answer` is set when the turn can be answered without Llama.
+
+    Runs as a stage graph: with Pipeline.speculative_nlu the original text is parsed by Rasa NLU
+    while the language is detected. If the text is English that parse is fed to the dialogue
+    directly; otherwise it is discarded (parsing has no tracker side effects).
+    langdetect always runs; a plausible `language_hint` from the platform is used unless the detection
+    confidently disagrees (the user switched language), in which case the detection wins and is
+    reported as "detected" so the platform updates the session language.
+    """
+    message = request.message
     agent = app.state.agent
+    hint = request.language_hint if request.language_hint and hint_is_plausible(request.language_hint, message) else None
+    detection = {"confidence": None, "source": "detected"}
+
+    async def detect():
+        user_language, detection["confidence"] = await asyncio.to_thread(detect_language_with_confidence, message)
+        print(f"[DEBUG] Detected user_language={user_language} ({type(user_language)})\n")
+        if hint and user_language != hint and detection_overrides_hint(message, detection["confidence"]):
+            language_source_stats["hint_overridden"] += 1
+            print(f"[DEBUG] Detection overrides language_hint={hint}\n")
+        elif hint:
+            detection["source"] = "hint"
+            user_language = hint
+        language_source_stats[detection["source"]] += 1
+        return user_language
+
+    async def speculative_parse():
+        # with a non-English hint the original text only reaches Rasa if detection overrides the hint,
+        # so don't parse it speculatively
+        if not pipeline_option('speculative_nlu') or (hint and not is_english(hint)):
+            return None
+        try:
+            return await agent.parse_message(message)
+        except Exception as e:
+            print(f"[ERROR] Speculative NLU parse failed: {e}")
+            return None
 
-    if isinstance(user_language, str) and user_language.lower() != "english":
-        english_message = translate_to_english(message, user_language)
+    async def english(detect):
+        if is_english(detect):
+            return message
+        english_message = await asyncio.to_thread(translate_to_english, message, detect)
         print(f"[DEBUG] english_message={english_message}\n")
-        responses = await agent.handle_text(english_message, sender_id=session_id)
-    else:
-        english_message = message
-        responses = await agent.handle_text(message, sender_id=session_id)
+        return english_message
+
+    async def rasa(detect, speculative_parse, english):
+        if is_english(detect) and speculative_parse is not None:
+            from rasa.core.channels.channel import CollectingOutputChannel, UserMessage
+            user_message = UserMessage(message, CollectingOutputChannel(), session_id, parse_data=speculative_parse)
+            return await agent.handle_message(user_message)
+        return await agent.handle_text(english, sender_id=session_id)
+
+    graph = (
+        StageGraph()
+        .add("detect", detect)
+        .add("speculative_parse", speculative_parse)
+        .add("english", english, deps=("detect",))
+        .add("rasa", rasa, deps=("detect", "speculative_parse", "english"))
+    )
+    results = await graph.run()
+    user_language = results["detect"]
+    responses = results["rasa"]
 
     answer = responses[0].get("text", "") if responses else ""
     print(f"[DEBUG] rasa text: {answer}\n")
 
-    system_message = f"... Context:\n{answer}\n..."
-    formatted_prompt = format_llama_prompt(system_message, message, chat_history)
+    turn = {
+        "session_id": session_id,
+        "message": message,
+        "chat_history": request.history,
+        "user_language": user_language,
+        "language_confidence": detection["confidence"],
+        "language_source": detection["source"],
+        "english_message": results["english"],
+        "answer": answer,
+        "fast_answer": None,
+        "timings": graph.timings,
+    }
+
+    fast_path_stats["total"] += 1
+    confidence = await get_intent_confidence(agent, session_id)
+    if is_fast_path_answer(answer, confidence):
+        fast_path_stats["fast_path"] += 1
+        print(f"[DEBUG] fast path: verbatim answer (confidence={confidence:.2f})\n")
+        turn["fast_answer"] = translate_from_english_cached(answer, user_language)
+    return turn
+
+
+# Kept free of per-turn text: the system message and the history then form a prefix that is
+# identical from one turn to the next (prompt caching, see prompt_cache.py).
+GENERATION_SYSTEM_MESSAGE = "..."
+
+
+def generation_conversation(turn: dict) -> tuple:
+    """(system_message, history, user_message) for the generation call; the Rasa context goes with the new user turn."""
+    history = list(turn["chat_history"] or [])
+    # the platform's history already ends with the message being answered
+    if history and history[-1].get("role") == "user" and history[-1].get("content") == turn["message"]:
+        history.pop()
+    user_message = f"Context:\n{turn['answer']}\n...\n\n{turn['message']}"
+    return GENERATION_SYSTEM_MESSAGE, history, user_message
+
+
+def generation_prompt(turn: dict) -> str:
+    system_message, history, user_message = generation_conversation(turn)
+    return format_llama_prompt(system_message, user_message, history)
+
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+async def translate_reply(text: str, target_language) -> str:
+    """translate_from_english, fanned out per sentence when Pipeline.parallel_reply_translation is on."""
+    if is_english(target_language):
+        return text
+    sentences = [sentence for sentence in SENTENCE_END.split(text) if sentence.strip()]
+    if not pipeline_option('parallel_reply_translation') or len(sentences) < 2:
+        return await asyncio.to_thread(translate_from_english, text, target_language)
+    parts = await asyncio.gather(*(
+        asyncio.to_thread(translate_from_english, sentence, target_language) for sentence in sentences
+    ))
+    return " ".join(parts)
+
+
+async def timed(turn: dict, stage: str, awaitable):
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        turn["timings"][stage] = (time.perf_counter() - started) * 1000
+
+
+async def run_chat_pipeline(session_id: str, request: ChatRequest):
+    turn = await prepare_turn(session_id, request)
+    if turn["fast_answer"] is not None:
+        record_stage_timings(turn["timings"])
+        return turn_response(turn, turn["fast_answer"])
+
+    formatted_prompt = generation_prompt(turn)
+    user_language = turn["user_language"]
 
     try:
-        request_body = {
-            "prompt": formatted_prompt,
-            "max_gen_len": 500,
-            "temperature": 0.7,
-            "top_p": 0.9
-        }
-        response = bedrock_client.invoke_model(
-            modelId=config['AWS']['model_id'],
-            body=json.dumps(request_body),
-            contentType='application/json',
-            accept='application/json'
-        )
-        response_body = json.loads(response['body'].read())
-        english_response = response_body.get('generation', '')
-
-        model_response = translate_from_english(english_response, user_language)
+        task = route_generation_task(turn["english_message"], turn["answer"])
+        english_response = await timed(turn, "generate", asyncio.to_thread(
+            invoke_llama, task, formatted_prompt, turn["english_message"] + turn["answer"],
+            generation_conversation(turn), session_id
+        ))
+
+        model_response = await timed(turn, "translate_reply", translate_reply(english_response, user_language))
     except Exception as e:
         print(f"[ERROR] Bedrock error: {e}")
         model_response = translate_from_english("Sorry, there was an error.", user_language)
 
     print(f"[DEBUG] model_response: {model_response}\n")
 
-    return {
-        "session_id": session_id,
-        "answer": model_response,
-        "detected_language": user_language,
-        "original_message": message,
-        "translated_message": english_message if isinstance(user_language, str) and user_language.lower() != "english" else None
-    }
+    record_stage_timings(turn["timings"])
+    return turn_response(turn, model_response)
+
+
+# -----------------------------
+# Streaming variant for the platform's WebSocket channel: newline-delimited JSON events
+#   {"type": "token", "text": ...} ... {"type": "done", **turn_response}
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    session_id = request.session_id or str(uuid.uuid4())
+
+    def token(text):
+        return json.dumps({"type": "token", "text": text}) + "\n"
+
+    def done(response):
+        if not finished.done():
+            finished.set_result(response)
+        return json.dumps({"type": "done", **response}) + "\n"
+
+    # single-flight with /chat/: a duplicate send waits for the run in flight and gets its reply in one token
+    key = (session_id, request.message)
+    shared = _inflight.get(key)
+    if shared is not None:
+        print(f"[DEBUG] coalescing duplicate stream request for session {session_id}\n")
+        try:
+            response = await asyncio.shield(shared)
+        except Overloaded as e:
+            return too_many_requests(e)
+        except asyncio.CancelledError:
+            if not shared.cancelled():
+                raise
+            response = None
+        except Exception:
+            response = None
+        if response is not None:
+            return StreamingResponse(iter([token(response["answer"]), json.dumps({"type": "done", **response}) + "\n"]),
+                                     media_type="application/x-ndjson")
+        # the shared run ended without a reply: run this request itself
+        return await chat_stream_endpoint(request)
+
+    # reject before the 200 is sent; the slot itself is held inside the stream
+    try:
+        get_scheduler().check(session_id)
+    except Overloaded as e:
+        return too_many_requests(e)
+
+    finished = asyncio.get_running_loop().create_future()
+
+    async def events():
+        # registered once the body is actually streamed, so a response that never starts leaves no entry
+        if key not in _inflight:
+            _inflight[key] = finished
+            finished.add_done_callback(lambda f: _inflight.pop(key) if _inflight.get(key) is f else None)
+        try:
+            async with get_scheduler().slot(session_id, check=False):
+                async for event in turn_events():
+                    yield event
+        finally:
+            # client disconnected mid-stream: duplicates waiting on this run start their own
+            finished.cancel()
+
+    async def turn_events():
+        turn = await prepare_turn(session_id, request)
+        if turn["fast_answer"] is not None:
+            record_stage_timings(turn["timings"])
+            yield token(turn["fast_answer"])
+            yield done(turn_response(turn, turn["fast_answer"]))
+            return
+
+        user_language = turn["user_language"]
+        # Non-English replies: with parallel_reply_translation each finished sentence is translated
+        # while generation continues, and emitted in order; otherwise the reply is translated at the end.
+        pipelined = not is_english(user_language) and pipeline_option('parallel_reply_translation')
+        task = route_generation_task(turn["english_message"], turn["answer"])
+        chunks, pending, translated, buffer = [], [], [], ""
+        started = time.perf_counter()
+        try:
+            async for chunk in stream_llama(task, generation_prompt(turn), turn["english_message"] + turn["answer"],
+                                            generation_conversation(turn), session_id):
+                chunks.append(chunk)
+                if is_english(user_language):
+                    yield token(chunk)
+                elif pipelined:
+                    *sentences, buffer = SENTENCE_END.split(buffer + chunk)
+                    pending.extend(
+                        asyncio.ensure_future(asyncio.to_thread(translate_from_english, sentence, user_language))
+                        for sentence in sentences if sentence.strip()
+                    )
+                    while pending and pending[0].done():
+                        translated.append(pending.pop(0).result())
+                        yield token(translated[-1] + " ")
+            turn["timings"]["generate"] = (time.perf_counter() - started) * 1000
+            if pipelined:
+                if buffer.strip():
+                    pending.append(asyncio.ensure_future(asyncio.to_thread(translate_from_english, buffer, user_language)))
+                for pending_translation in pending:
+                    translated.append(await pending_translation)
+                    yield token(translated[-1] + " ")
+                model_response = " ".join(translated)
+            else:
+                model_response = await timed(turn, "translate_reply", asyncio.to_thread(
+                    translate_from_english, "".join(chunks), user_language
+                ))
+        except Exception as e:
+            print(f"[ERROR] Bedrock stream error: {e}")
+            for pending_translation in pending:
+                pending_translation.cancel()
+            model_response = translate_from_english("Sorry, there was an error.", user_language)
+            chunks = translated = []
+        if not chunks or not (is_english(user_language) or translated):
+            yield token(model_response)
+        record_stage_timings(turn["timings"])
+        yield done(turn_response(turn, model_response))
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+startup_timings["import_chat_app"] = round((time.perf_counter() - _import_started) * 1000, 1)
@@ -0,0 +1,131 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing when a limit is hit; `retry_after` is a hint in seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class FairScheduler:
+    """
+    Bounds concurrent pipeline runs: at most `max_concurrent` overall and `max_per_session`
+    per session. Waiting runs are queued per session and freed slots go round-robin across
+    sessions, so one busy session cannot starve the others. A session with `max_queued_per_session`
+    runs already waiting, or a full queue (`max_queued`), is rejected with Overloaded.
+    """
+
+    def __init__(self, max_concurrent=8, max_per_session=1, max_queued_per_session=2, max_queued=64):
+        self.max_concurrent = max_concurrent
+        self.max_per_session = max_per_session
+        self.max_queued_per_session = max_queued_per_session
+        self.max_queued = max_queued
+        self.running = 0
+        self.running_by_session = defaultdict(int)
+        self.waiting = OrderedDict()  # session_id -> deque of futures; order = round-robin turn
+        self.queued = 0
+        self.rejected = 0
+        self.avg_run_s = 5.0  # EWMA of run time, for Retry-After
+
+    def check(self, session_id: str):
+        """Raise Overloaded if a new run for this session would be rejected."""
+        session_waiting = len(self.waiting.get(session_id, ()))
+        if session_waiting >= self.max_queued_per_session:
+            self._reject("Too many requests in flight for this session", session_waiting + 1, self.max_per_session)
+        if self.queued >= self.max_queued:
+            self._reject("Server busy", self.queued + 1, self.max_concurrent)
+
+    def _reject(self, reason, ahead, slots):
+        self.rejected += 1
+        raise Overloaded(reason, max(1, math.ceil(self.avg_run_s * ahead / slots)))
+
+    def _can_start(self, session_id):
+        return self.running < self.max_concurrent and self.running_by_session.get(session_id, 0) < self.max_per_session
+
+    def _start(self, session_id):
+        self.running += 1
+        self.running_by_session[session_id] += 1
+
+    def _dispatch(self):
+        # one pass over the sessions in turn order; a session that gets a slot goes to the back
+        for session_id in list(self.waiting):
+            if self.running >= self.max_concurrent:
+                return
+            queue = self.waiting[session_id]
+            while queue and queue[0].done():  # cancelled while waiting
+                queue.popleft()
+                self.queued -= 1
+            if queue and self._can_start(session_id):
+                self._start(session_id)
+                self.queued -= 1
+                queue.popleft().set_result(None)
+            if queue:
+                self.waiting.move_to_end(session_id)
+            else:
+                del self.waiting[session_id]
+
+    async def acquire(self, session_id: str, check: bool = True):
+        if check:
+            self.check(session_id)
+        if not self.waiting and self._can_start(session_id):
+            self._start(session_id)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.setdefault(session_id, deque()).append(future)
+        self.queued += 1
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # slot was handed over just as we were cancelled
+                self.release(session_id)
+            else:
+                # leave the queue now, not when _dispatch next reaches it: a full server may not
+                # dispatch for a while and the waiter would still count against max_queued
+                self._remove_waiter(session_id, future)
+                self._dispatch()
+            raise
+
+    def _remove_waiter(self, session_id, future):
+        queue = self.waiting.get(session_id)
+        if queue is None or future not in queue:
+            return  # already dropped by _dispatch
+        queue.remove(future)
+        self.queued -= 1
+        if not queue:
+            del self.waiting[session_id]
+
+    def release(self, session_id: str, run_s: float = None):
+        self.running -= 1
+        self.running_by_session[session_id] -= 1
+        if not self.running_by_session[session_id]:
+            del self.running_by_session[session_id]
+        if run_s is not None:
+            self.avg_run_s = 0.8 * self.avg_run_s + 0.2 * run_s
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, session_id: str, check: bool = True):
+        await self.acquire(session_id, check=check)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(session_id, time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "waiting_sessions": len(self.waiting),
+            "rejected": self.rejected,
+            "avg_run_s": round(self.avg_run_s, 2),
+        }
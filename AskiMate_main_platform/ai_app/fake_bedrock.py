@@ -0,0 +1,127 @@
+import io
+import json
+import threading
+import time
+
+from prompt_cache import estimate_tokens, prompt_fingerprint
+
+# Llama 3 message boundary; the fake caches InvokeModel prompts at these points
+LLAMA_EOT = "<|eot_id|>"
+
+
+class FakeBedrockClient:
+    """
+    Local stand-in for the bedrock-runtime client (BEDROCK_FAKE=1) that simulates prompt caching:
+    prefixes up to each cache checkpoint (Converse `cachePoint` blocks, or Llama message
+    boundaries for InvokeModel) are remembered for `cache_ttl` seconds, and a later request that
+    starts with one pays `cached_price_ratio` of the input price and `cached_latency_ratio` of the
+    prefill time for those tokens. Replies echo the last user message.
+    """
+
+    def __init__(self, cache_ttl=300, prefill_s_per_token=0.0002, cached_latency_ratio=0.1,
+                 price_per_1k_input=0.00022, cached_price_ratio=0.1, sleep=True):
+        self.cache_ttl = cache_ttl
+        self.prefill_s_per_token = prefill_s_per_token
+        self.cached_latency_ratio = cached_latency_ratio
+        self.price_per_1k_input = price_per_1k_input
+        self.cached_price_ratio = cached_price_ratio
+        self.sleep = sleep
+        self._prefixes = {}  # fingerprint -> expiry
+        self._lock = threading.Lock()
+        self.totals = {"requests": 0, "input_tokens": 0, "cache_read_tokens": 0,
+                       "cost": 0.0, "cost_without_cache": 0.0, "prefill_s": 0.0, "prefill_s_without_cache": 0.0}
+
+    # -- cache simulation
+    def _simulate(self, checkpoints: list, prompt: str) -> dict:
+        """checkpoints: prefix strings of `prompt` where a cache entry may be written/read."""
+        now = time.monotonic()
+        with self._lock:
+            self._prefixes = {k: exp for k, exp in self._prefixes.items() if exp > now}
+            hit = ""
+            for prefix in checkpoints:
+                if self._prefixes.get(prompt_fingerprint(prefix), 0) > now:
+                    hit = prefix if len(prefix) > len(hit) else hit
+            for prefix in checkpoints:
+                self._prefixes[prompt_fingerprint(prefix)] = now + self.cache_ttl
+
+            input_tokens = estimate_tokens(prompt)
+            cache_read = estimate_tokens(hit)
+            cache_write = max(0, estimate_tokens(checkpoints[-1]) - cache_read) if checkpoints else 0
+            uncached = input_tokens - cache_read
+            cost = (uncached + cache_read * self.cached_price_ratio) * self.price_per_1k_input / 1000
+            prefill_s = (uncached + cache_read * self.cached_latency_ratio) * self.prefill_s_per_token
+
+            t = self.totals
+            t["requests"] += 1
+            t["input_tokens"] += input_tokens
+            t["cache_read_tokens"] += cache_read
+            t["cost"] += cost
+            t["cost_without_cache"] += input_tokens * self.price_per_1k_input / 1000
+            t["prefill_s"] += prefill_s
+            t["prefill_s_without_cache"] += input_tokens * self.prefill_s_per_token
+        if self.sleep:
+            time.sleep(prefill_s)
+        return {"inputTokens": input_tokens, "cacheReadInputTokens": cache_read, "cacheWriteInputTokens": cache_write}
+
+    def stats(self) -> dict:
+        return {k: round(v, 6) if isinstance(v, float) else v for k, v in self.totals.items()}
+
+    # -- InvokeModel (Llama prompt format)
+    def _invoke(self, body: str):
+        prompt = json.loads(body)["prompt"]
+        checkpoints, pos = [], prompt.find(LLAMA_EOT)
+        while pos != -1:
+            checkpoints.append(prompt[:pos + len(LLAMA_EOT)])
+            pos = prompt.find(LLAMA_EOT, pos + 1)
+        # the last boundary closes the new user turn; only earlier ones are a reusable prefix
+        usage = self._simulate(checkpoints[:-1], prompt)
+        last_user = prompt.rsplit("user<|end_header_id|>\n\n", 1)[-1].split(LLAMA_EOT)[0]
+        return f"(fake) {last_user[:200]}", usage
+
+    def _headers(self, usage):
+        return {"HTTPHeaders": {
+            "x-amzn-bedrock-input-token-count": str(usage["inputTokens"]),
+            "x-amzn-bedrock-cache-read-input-token-count": str(usage["cacheReadInputTokens"]),
+            "x-amzn-bedrock-cache-write-input-token-count": str(usage["cacheWriteInputTokens"]),
+        }}
+
+    def invoke_model(self, modelId, body, contentType=None, accept=None):
+        text, usage = self._invoke(body)
+        payload = {"generation": text, "prompt_token_count": usage["inputTokens"], "stop_reason": "stop"}
+        return {"body": io.BytesIO(json.dumps(payload).encode()), "ResponseMetadata": self._headers(usage)}
+
+    def invoke_model_with_response_stream(self, modelId, body, contentType=None, accept=None):
+        text, usage = self._invoke(body)
+        events = [{"chunk": {"bytes": json.dumps({"generation": word + " "}).encode()}} for word in text.split()]
+        return {"body": iter(events), "ResponseMetadata": self._headers(usage)}
+
+    # -- Converse
+    def _converse(self, system, messages):
+        parts, checkpoints = [], []
+        for block in system or []:
+            if "cachePoint" in block:
+                checkpoints.append("".join(parts))
+            else:
+                parts.append("system:" + block.get("text", ""))
+        for message in messages:
+            for block in message["content"]:
+                if "cachePoint" in block:
+                    checkpoints.append("".join(parts))
+                else:
+                    parts.append(message["role"] + ":" + block.get("text", ""))
+        usage = self._simulate(checkpoints, "".join(parts))
+        last_user = next((b["text"] for b in reversed(messages[-1]["content"]) if "text" in b), "")
+        text = f"(fake) {last_user[:200]}"
+        usage["outputTokens"] = estimate_tokens(text)
+        return text, usage
+
+    def converse(self, modelId, messages, system=None, inferenceConfig=None, **kwargs):
+        text, usage = self._converse(system, messages)
+        return {"output": {"message": {"role": "assistant", "content": [{"text": text}]}},
+                "usage": usage, "stopReason": "end_turn"}
+
+    def converse_stream(self, modelId, messages, system=None, inferenceConfig=None, **kwargs):
+        text, usage = self._converse(system, messages)
+        events = [{"contentBlockDelta": {"delta": {"text": word + " "}}} for word in text.split()]
+        events.append({"metadata": {"usage": usage}})
+        return {"stream": iter(events)}
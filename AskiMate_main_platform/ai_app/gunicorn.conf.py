@@ -0,0 +1,30 @@
+# Production server for ai_app:  gunicorn -c gunicorn.conf.py chat_app:app
+#
+# One worker by default. Rasa's tracker and lock stores are in memory, and so are the
+# single-flight map, the FairScheduler and the PrefixReuseTracker in chat_app; with several
+# workers, requests for one session_id would land on different dialogue state and limits.
+# The Rasa agent (TensorFlow) is loaded in the worker after the fork, never in the master:
+# TensorFlow's thread pools and locks do not survive a fork.
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Rasa model load can exceed gunicorn's default 30s on small instances
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "180"))
+
+
+def when_ready(server):
+    if workers > 1:
+        server.log.warning(
+            f"WEB_CONCURRENCY={workers}: each worker keeps its own Rasa trackers, scheduler and "
+            "in-flight map, so one session's requests may see different state"
+        )
+
+
+def post_worker_init(worker):
+    import chat_app
+
+    chat_app.get_config()
+    chat_app.load_agent()
+    worker.log.info(f"Loaded Rasa agent, startup breakdown (ms): {chat_app.startup_timings}")
@@ -0,0 +1,114 @@
+import hashlib
+from collections import OrderedDict
+
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for Llama/Claude tokenizers on English text
+    return max(1, len(text) // 4) if text else 0
+
+
+def supports_cache_points(model_id: str, config: dict) -> bool:
+    """Bedrock prompt caching is model specific; config lists the model id fragments that support it."""
+    return any(fragment in model_id for fragment in config.get('cache_point_models', []))
+
+
+def converse_request(system_message: str, history: list, user_message: str, cache_points: bool) -> dict:
+    """
+    Converse API arguments for a chat turn. With cache_points, a cache checkpoint is placed after
+    the system message and after the last history message, so the next turn reuses both.
+    Roles must alternate starting with the user, so consecutive same-role messages are merged.
+    """
+    messages = []
+    for msg in history:
+        role = "user" if msg.get("role") == "user" else "assistant"
+        if not messages and role == "assistant":
+            continue
+        if messages and messages[-1]["role"] == role:
+            messages[-1]["content"][0]["text"] += "\n\n" + msg.get("content", "")
+        else:
+            messages.append({"role": role, "content": [{"text": msg.get("content", "")}]})
+    if cache_points and messages:
+        messages[-1]["content"].append(CACHE_POINT)
+    if messages and messages[-1]["role"] == "user":
+        messages[-1]["content"].append({"text": user_message})
+    else:
+        messages.append({"role": "user", "content": [{"text": user_message}]})
+
+    system = [{"text": system_message}]
+    if cache_points:
+        system.append(CACHE_POINT)
+    return {"system": system, "messages": messages}
+
+
+class PrefixReuseTracker:
+    """
+    Per-session prompt prefix reuse. Each generation prompt is compared with the session's
+    previous one: the shared leading part is what a prompt cache could serve. When Bedrock
+    reports cache reads (Converse `usage`, or the InvokeModel cache headers) those numbers are used,
+    otherwise the reusable part is estimated from the text. Savings are only reported from the
+    cache reads Bedrock returned; an estimated reuse was not billed any cheaper.
+    """
+
+    def __init__(self, max_sessions: int = 2000, cached_input_discount: float = 0.9):
+        self.max_sessions = max_sessions
+        self.cached_input_discount = cached_input_discount
+        self.last_prompt = OrderedDict()  # session_id -> previous prompt
+        self.sessions = OrderedDict()     # session_id -> counters
+        self.totals = self._counters()
+
+    @staticmethod
+    def _counters() -> dict:
+        return {"calls": 0, "reused_calls": 0, "input_tokens": 0, "reused_tokens": 0,
+                "reported_cache_reads": 0, "cache_read_tokens": 0}
+
+    def record(self, session_id: str, prompt: str, usage: dict = None) -> dict:
+        previous = self.last_prompt.pop(session_id, "")
+        shared = 0
+        for a, b in zip(previous, prompt):
+            if a != b:
+                break
+            shared += 1
+
+        input_tokens = (usage or {}).get("inputTokens") or estimate_tokens(prompt)
+        cache_read = (usage or {}).get("cacheReadInputTokens")
+        reused_tokens = cache_read if cache_read is not None else estimate_tokens(prompt[:shared])
+
+        session = self.sessions.pop(session_id, None) or self._counters()
+        for counters in (session, self.totals):
+            counters["calls"] += 1
+            counters["reused_calls"] += 1 if reused_tokens else 0
+            counters["input_tokens"] += input_tokens
+            counters["reused_tokens"] += reused_tokens
+            counters["reported_cache_reads"] += 1 if cache_read is not None else 0
+            counters["cache_read_tokens"] += cache_read or 0
+
+        self.last_prompt[session_id] = prompt
+        self.sessions[session_id] = session
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+        while len(self.last_prompt) > self.max_sessions:
+            self.last_prompt.popitem(last=False)
+        return session
+
+    def summary(self, counters: dict) -> dict:
+        calls = counters["calls"]
+        summary = {
+            **counters,
+            "reuse_rate": round(counters["reused_calls"] / calls, 3) if calls else 0.0,
+            "reused_token_share": round(counters["reused_tokens"] / counters["input_tokens"], 3) if counters["input_tokens"] else 0.0,
+        }
+        if counters["reported_cache_reads"]:
+            # input tokens saved if cached reads cost (1 - discount) of a normal input token
+            summary["saved_input_tokens"] = int(counters["cache_read_tokens"] * self.cached_input_discount)
+        return summary
+
+    def stats(self, session_id: str = None) -> dict:
+        if session_id is not None:
+            return self.summary(self.sessions.get(session_id) or self._counters())
+        return {**self.summary(self.totals), "sessions": len(self.sessions)}
+
+
+def prompt_fingerprint(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
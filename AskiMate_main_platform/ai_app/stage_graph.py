@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+
+class StageGraph:
+    """
+    Tiny async DAG runner for the chat pipeline.
+    Each stage is `async fn(**results_of_its_deps)` and starts as soon as its dependencies finish,
+    so independent stages run concurrently. Wall time per stage is kept in `timings` (ms).
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.timings = {}
+
+    def add(self, name, fn, deps=()):
+        missing = [dep for dep in deps if dep not in self.stages]
+        if missing:
+            raise ValueError(f"Stage {name} depends on unknown stages {missing}")
+        self.stages[name] = (fn, tuple(deps))
+        return self
+
+    async def run(self) -> dict:
+        tasks = {}
+
+        async def run_stage(name, fn, deps):
+            kwargs = {dep: await tasks[dep] for dep in deps}
+            started = time.perf_counter()
+            try:
+                return await fn(**kwargs)
+            finally:
+                self.timings[name] = (time.perf_counter() - started) * 1000
+
+        for name, (fn, deps) in self.stages.items():
+            tasks[name] = asyncio.ensure_future(run_stage(name, fn, deps))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        return {name: task.result() for name, task in tasks.items()}
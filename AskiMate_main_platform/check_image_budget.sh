@@ -0,0 +1,58 @@
+#!/usr/bin/env sh
+# Build both images and check them against the size / startup-time budget.
+# Run from the repository root:  sh AskiMate_main_platform/check_image_budget.sh
+# Needs the ai_app Rasa model in AskiMate_main_platform/ai_app/models/ and a .env for the platform.
+set -eu
+
+AI_APP_MAX_MB=${AI_APP_MAX_MB:-2500}
+MAINPLATFORM_MAX_MB=${MAINPLATFORM_MAX_MB:-350}
+AI_APP_MAX_START_S=${AI_APP_MAX_START_S:-90}
+MAINPLATFORM_MAX_START_S=${MAINPLATFORM_MAX_START_S:-10}
+ENV_FILE=${ENV_FILE:-AskiMate_main_platform/.env}
+
+status=0
+
+build() {
+    # $1 image tag, $2 Dockerfile
+    start=$(date +%s)
+    DOCKER_BUILDKIT=1 docker build -q -t "$1" -f "$2" . > /dev/null
+    echo "$1: built in $(( $(date +%s) - start ))s"
+}
+
+check_size() {
+    # $1 image tag, $2 budget in MB
+    size_mb=$(( $(docker image inspect --format '{{.Size}}' "$1") / 1024 / 1024 ))
+    if [ "$size_mb" -gt "$2" ]; then
+        echo "$1: image size ${size_mb}MB exceeds budget ${2}MB"
+        status=1
+    else
+        echo "$1: image size ${size_mb}MB (budget ${2}MB)"
+    fi
+}
+
+check_startup() {
+    # $1 image tag, $2 budget in seconds, $3 path; time from `docker run` until the path answers
+    container=$(docker run -d --env-file "$ENV_FILE" -p 18000:8000 "$1")
+    start=$(date +%s)
+    until python3 -c "import urllib.request; urllib.request.urlopen('http://localhost:18000$3', timeout=2)" 2>/dev/null; do
+        if [ $(( $(date +%s) - start )) -gt "$2" ]; then
+            echo "$1: not healthy within ${2}s budget"
+            status=1
+            break
+        fi
+        sleep 1
+    done
+    elapsed=$(( $(date +%s) - start ))
+    [ "$elapsed" -le "$2" ] && echo "$1: healthy after ${elapsed}s (budget ${2}s)"
+    docker rm -f "$container" > /dev/null
+}
+
+build askimate-ai-app AskiMate_main_platform/ai_app/Dockerfile
+build askimate-mainplatform AskiMate_main_platform/mainplatform/Dockerfile
+
+check_size askimate-ai-app "$AI_APP_MAX_MB"
+check_size askimate-mainplatform "$MAINPLATFORM_MAX_MB"
+check_startup askimate-ai-app "$AI_APP_MAX_START_S" /health
+check_startup askimate-mainplatform "$MAINPLATFORM_MAX_START_S" /
+
+exit $status
@@ -27,6 +27,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "channels",
     "social_django",
     "home_page",
 ]
@@ -50,8 +51,14 @@ TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [],
-        "APP_DIRS": True,
         "OPTIONS": {
+            # compiled templates are kept in memory per process
+            "loaders": [
+                ("django.template.loaders.cached.Loader", [
+                    "django.template.loaders.filesystem.Loader",
+                    "django.template.loaders.app_directories.Loader",
+                ]),
+            ],
             "context_processors": [
                 "django.template.context_processors.debug",
                 "django.template.context_processors.request",
@@ -65,6 +72,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "AskiMate_platform.wsgi.application"
+ASGI_APPLICATION = "AskiMate_platform.asgi.application"  # WebSocket chat (home_page/consumers.py)
 
 # پایگاه داده با SSL
 DATABASES = {
@@ -80,6 +88,37 @@ DATABASES = {
         },
     }
 }
+if os.getenv("DB_ENGINE") == "sqlite":
+    # برای توسعه‌ی محلی؛ جستجو از FTS5 استفاده می‌کند (home_page/search.py)
+    DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": BASE_DIR / "db.sqlite3"}}
+
+# کش: Redis اگر REDIS_URL باشد (مشترک بین workerها)، وگرنه حافظه‌ی هر process
+# KEY_PREFIX per release, so cached template fragments never outlive a deploy
+RELEASE_VERSION = os.getenv("RENDER_GIT_COMMIT", "dev")[:12]
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+            "KEY_PREFIX": RELEASE_VERSION,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "KEY_PREFIX": RELEASE_VERSION,
+        }
+    }
+
+# سشن‌ها: با Redis خواندن از کش، نوشتن در کش و دیتابیس (cached_db)؛ بدون Redis فقط دیتابیس،
+# چون LocMem بین processها مشترک نیست و سشنِ حذف‌شده در کش بقیه‌ی workerها معتبر می‌ماند
+# SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies removes the DB entirely
+SESSION_ENGINE = os.getenv(
+    "SESSION_ENGINE",
+    "django.contrib.sessions.backends.cached_db" if os.getenv("REDIS_URL") else "django.contrib.sessions.backends.db"
+)
+SESSION_SAVE_EVERY_REQUEST = False
 
 # رمز عبور
 AUTH_PASSWORD_VALIDATORS = [
@@ -99,7 +138,12 @@ USE_TZ = True
 STATIC_URL = "/static/"
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 STATICFILES_DIRS = [os.path.join(BASE_DIR, "home_page/static")]
-STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+# Django 5 reads STORAGES (STATICFILES_STORAGE is gone). Hashed names let WhiteNoise serve
+# static files with a far-future Cache-Control; gzip + Brotli (the Brotli package) are precompressed.
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
+}
 
 # Media files
 MEDIA_URL = "/media/"
@@ -129,11 +173,57 @@ AUTHENTICATION_BACKENDS = (
 
 SOCIAL_AUTH_GOOGLE_OAUTH2_KEY = os.getenv("SOCIAL_AUTH_GOOGLE_OAUTH2_KEY")
 SOCIAL_AUTH_GOOGLE_OAUTH2_SECRET = os.getenv("SOCIAL_AUTH_GOOGLE_OAUTH2_SECRET")
+# the default pipeline plus reject_taken_email: a first Google login whose email is already registered
+# is refused, not linked to that account (local signup does not verify emails) and not duplicated
+SOCIAL_AUTH_PIPELINE = (
+    "social_core.pipeline.social_auth.social_details",
+    "social_core.pipeline.social_auth.social_uid",
+    "social_core.pipeline.social_auth.auth_allowed",
+    "social_core.pipeline.social_auth.social_user",
+    "social_core.pipeline.user.get_username",
+    "home_page.pipeline.reject_taken_email",
+    "social_core.pipeline.user.create_user",
+    "social_core.pipeline.social_auth.associate_user",
+    "social_core.pipeline.social_auth.load_extra_data",
+    "social_core.pipeline.user.user_details",
+)
 LOGIN_URL = "login"
 LOGOUT_URL = "logout"
 LOGIN_REDIRECT_URL = "/chat/"
 LOGOUT_REDIRECT_URL = "/"
 
+# Chat turns: with CHAT_ASYNC_TURNS the POST returns 202 and `manage.py run_chat_workers` calls ai_app
+CHAT_ASYNC_TURNS = os.getenv("CHAT_ASYNC_TURNS", "False") == "True"
+CHAT_JOB_POLL_INTERVAL = 1  # seconds before the client's first job-status poll; it backs off from there
+# per-user token bucket for chat messages (home_page/ratelimit.py); global only with REDIS_URL,
+# otherwise it applies per process (N gunicorn workers -> up to N times the limit)
+CHAT_RATE_LIMIT_PER_MINUTE = int(os.getenv("CHAT_RATE_LIMIT_PER_MINUTE", 10))
+CHAT_RATE_LIMIT_BURST = int(os.getenv("CHAT_RATE_LIMIT_BURST", 5))
+# minimum langdetect probability before a session's language is stored and sent to ai_app as a hint
+CHAT_LANGUAGE_CONFIDENCE = 0.95
+
+# `manage.py archive_chat_sessions` moves idle sessions to gzipped JSONL files and deletes the rows,
+# so the files are the only copy: they go to STORAGES["chat_archive"], which must outlive a redeploy.
+# CHAT_ARCHIVE_S3_BUCKET (django-storages, AWS_* credentials) or CHAT_ARCHIVE_DIR on a mounted
+# volume; with neither (e.g. Render's free plan, no disk) archiving refuses to run.
+CHAT_ARCHIVE_AFTER_DAYS = int(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", 90))
+CHAT_ARCHIVE_PREFIX = "chat_archive"
+if os.getenv("CHAT_ARCHIVE_S3_BUCKET"):
+    STORAGES["chat_archive"] = {
+        "BACKEND": "storages.backends.s3.S3Storage",
+        "OPTIONS": {
+            "bucket_name": os.getenv("CHAT_ARCHIVE_S3_BUCKET"),
+            "region_name": os.getenv("AWS_REGION", "us-east-1"),
+            "default_acl": "private",
+            "file_overwrite": False,
+        },
+    }
+elif os.getenv("CHAT_ARCHIVE_DIR"):
+    STORAGES["chat_archive"] = {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {"location": os.getenv("CHAT_ARCHIVE_DIR")},
+    }
+
 # Logging
 LOG_DIR = os.path.join(BASE_DIR, "logs")
 os.makedirs(LOG_DIR, exist_ok=True)
@@ -0,0 +1,10 @@
+from django.contrib.auth.models import User
+from django.db.models.functions import Lower
+
+
+def users_with_email(email):
+    """
+    Case-insensitive email match. Blank emails are excluded so the query implies the predicate of the
+    partial index auth_user_email_lower_uniq (WHERE email <> '') and Postgres can use it for LOWER(email) = ...
+    """
+    return User.objects.exclude(email='').annotate(email_lower=Lower('email')).filter(email_lower=email.lower())
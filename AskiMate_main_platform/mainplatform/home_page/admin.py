@@ -0,0 +1,59 @@
+from datetime import timedelta
+from django.contrib import admin
+from django.db.models import Sum
+from django.utils import timezone
+from .models import DailyUsage, DailyLanguageUsage, RollupWatermark
+
+DASHBOARD_DAYS = 30
+
+
+class ReadOnlyRollupAdmin(admin.ModelAdmin):
+    """Rollups are written by `manage.py update_usage_rollups`; the admin only reads them."""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DailyUsage)
+class DailyUsageAdmin(ReadOnlyRollupAdmin):
+    list_display = ('date', 'user_messages', 'bot_messages', 'ai_errors', 'error_rate_display', 'active_users')
+    date_hierarchy = 'date'
+    change_list_template = 'admin/home_page/dailyusage/change_list.html'
+
+    @admin.display(description='Error rate')
+    def error_rate_display(self, obj):
+        return f"{obj.error_rate:.1%}"
+
+    def changelist_view(self, request, extra_context=None):
+        # داشبورد فقط از جدول‌های rollup می‌خواند، نه از ChatMessage
+        since = timezone.localdate() - timedelta(days=DASHBOARD_DAYS)
+        totals = DailyUsage.objects.filter(date__gt=since).aggregate(
+            user_messages=Sum('user_messages'), bot_messages=Sum('bot_messages'), ai_errors=Sum('ai_errors')
+        )
+        turns = (totals['bot_messages'] or 0) + (totals['ai_errors'] or 0)
+        languages = (
+            DailyLanguageUsage.objects.filter(date__gt=since)
+            .values('language').annotate(turns=Sum('turns')).order_by('-turns')[:10]
+        )
+        extra_context = {
+            **(extra_context or {}),
+            'dashboard_days': DASHBOARD_DAYS,
+            'totals': totals,
+            'error_rate': (totals['ai_errors'] or 0) / turns if turns else 0.0,
+            'languages': languages,
+            'watermark': RollupWatermark.objects.filter(name='chat_messages').first(),
+        }
+        return super().changelist_view(request, extra_context=extra_context)
+
+
+@admin.register(DailyLanguageUsage)
+class DailyLanguageUsageAdmin(ReadOnlyRollupAdmin):
+    list_display = ('date', 'language', 'turns')
+    list_filter = ('language',)
+    date_hierarchy = 'date'
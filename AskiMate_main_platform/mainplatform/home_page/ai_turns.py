@@ -0,0 +1,132 @@
+import json
+import logging
+import threading
+import httpx
+import requests
+from urllib.parse import urljoin
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+AI_APP_URL = "https://askimate-ai-app.onrender.com/chat"  # آدرس سرویس FastAPI
+AI_APP_STREAM_URL = AI_APP_URL.rstrip("/") + "/stream"
+AI_APP_READY_URL = urljoin(AI_APP_URL, "/ready")
+AI_APP_TIMEOUT = 120
+AI_APP_PREWARM_INTERVAL = 60  # seconds between warm-up pings
+
+
+def prewarm_ai_app():
+    """
+    Fire-and-forget readiness ping so a sleeping ai_app container starts loading Rasa
+    while the user is still on the page. Throttled through the cache to one ping per interval.
+    """
+    if not cache.add("ai_app_prewarm", True, AI_APP_PREWARM_INTERVAL):
+        return
+
+    def ping():
+        try:
+            requests.get(AI_APP_READY_URL, timeout=AI_APP_TIMEOUT)
+        except Exception as e:
+            logger.info(f"ai_app warm-up ping failed: {e}")
+
+    threading.Thread(target=ping, daemon=True).start()
+
+
+def build_ai_payload(session, user_text):
+    # ساخت history برای AI؛ پیام‌هایی که job آن‌ها شکست خورده جواب ندارند و فرستاده نمی‌شوند
+    # (در حالت sync همین پیام‌ها پاک می‌شوند)
+    history = [
+        {"role": "user" if m.sender == "user" else "bot", "content": m.message}
+        for m in ChatMessage.objects.filter(session=session).exclude(job__status="failed").order_by("timestamp")
+    ]
+    return {
+        "session_id": str(session.session_id),
+        "message": user_text,
+        "history": history,
+        # زبان سشن اگر قبلاً با اطمینان تشخیص داده شده؛ ai_app باز هم تشخیص می‌دهد و اگر با اطمینان مخالف باشد، hint کنار می‌رود
+        "language_hint": session.user_language if session.language_confirmed else None
+    }
+
+
+def learn_session_language(session, data):
+    """
+    Store the session language after a confident detection by ai_app, so later turns send it as a hint.
+    A detection that disagrees with the stored language (the user switched) replaces it the same way.
+    """
+    language = data.get("detected_language")
+    confidence = data.get("language_confidence") or 0
+    if data.get("language_source") != "detected" or not language or language == "Unknown":
+        return
+    if confidence < settings.CHAT_LANGUAGE_CONFIDENCE:
+        return
+    if session.language_confirmed and session.user_language == language:
+        return
+    session.user_language = language
+    session.language_confirmed = True
+    session.save(update_fields=["user_language", "language_confirmed"])
+
+
+def run_ai_turn(session, user_message, idempotency_key=None):
+    """
+    Send a stored user ChatMessage to ai_app and store the bot reply.
+    Used by chatbot_main (sync mode) and the chat workers (async mode).
+    Returns the bot ChatMessage; raises if ai_app fails.
+    """
+    payload = build_ai_payload(session, user_message.message)
+    resp = requests.post(AI_APP_URL, json=payload, timeout=AI_APP_TIMEOUT)
+    resp.raise_for_status()
+    data = resp.json()
+
+    learn_session_language(session, data)
+    return store_bot_reply(
+        session,
+        user_message,
+        data.get("answer", "No reply"),
+        data.get("detected_language", "English"),
+        idempotency_key
+    )
+
+
+def save_user_message(session, user_text, idempotency_key=None):
+    """
+    Store the user's ChatMessage. Returns (message, created); created is False for a repeated idempotency key.
+    The message is None if the earlier send with that key failed and was deleted in the meantime.
+    """
+    try:
+        return ChatMessage.objects.create(
+            session=session,
+            sender="user",
+            message=user_text,
+            detected_language="Unknown",
+            idempotency_key=idempotency_key
+        ), True
+    except IntegrityError:
+        return ChatMessage.objects.filter(session=session, sender="user", idempotency_key=idempotency_key).first(), False
+
+
+def store_bot_reply(session, user_message, ai_reply, detected_language, idempotency_key=None):
+    # آپدیت پیام کاربر با زبان شناسایی‌شده
+    user_message.detected_language = detected_language
+    user_message.save()
+
+    # ثبت جواب AI
+    return ChatMessage.objects.create(
+        session=session,
+        sender="bot",
+        message=ai_reply,
+        detected_language=detected_language,
+        idempotency_key=idempotency_key
+    )
+
+
+async def stream_ai_reply(payload):
+    """Yield the events of ai_app's /chat/stream endpoint: token events, then one done event."""
+    async with httpx.AsyncClient(timeout=AI_APP_TIMEOUT) as client:
+        async with client.stream("POST", AI_APP_STREAM_URL, json=payload) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if line.strip():
+                    yield json.loads(line)
@@ -0,0 +1,87 @@
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import takewhile
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import ChatMessage, DailyUsage, DailyLanguageUsage, DailyActiveUser, RollupWatermark
+
+logger = logging.getLogger(__name__)
+
+WATERMARK = "chat_messages"
+# ردیف‌های جدیدتر از این هنوز ممکن است تراکنش‌های هم‌زمان با id کمتر داشته باشند
+COMMIT_LAG = timedelta(minutes=1)
+# پیام‌های بازگردانده‌شده از بایگانی id جدید ولی زمان قدیمی دارند؛ دوباره شمرده نمی‌شوند
+RESTORED_SLACK = timedelta(hours=1)
+
+
+def increment_daily_usage(day, **counts):
+    """Add to the DailyUsage counters of `day` (row created on first use)."""
+    DailyUsage.objects.get_or_create(date=day)
+    DailyUsage.objects.filter(date=day).update(**{field: F(field) + n for field, n in counts.items() if n})
+
+
+def record_ai_error(count=1):
+    """Count failed AI turns for today; called where the failure is handled (no message row is written)."""
+    try:
+        increment_daily_usage(timezone.localdate(), ai_errors=count)
+    except Exception as e:
+        logger.warning(f"Could not record AI error in rollups: {e}")
+
+
+def update_rollups(batch_size=5000):
+    """
+    Fold ChatMessages newer than the watermark into the daily rollups, one batch per transaction.
+    Rows are taken in id order and each batch stops at the first row newer than the commit lag,
+    so the watermark never moves past a row that has not been counted.
+    Returns the number of messages processed.
+    """
+    processed = 0
+    cutoff = timezone.now() - COMMIT_LAG
+    while True:
+        with transaction.atomic():
+            mark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+            batch = list(
+                ChatMessage.objects.filter(id__gt=mark.last_id)
+                .order_by("id")
+                .values("id", "timestamp", "sender", "detected_language", "session__user_id")[:batch_size]
+            )
+            rows = list(takewhile(lambda row: row["timestamp"] < cutoff, batch))
+            if not rows:
+                return processed
+
+            usage = defaultdict(Counter)
+            languages = Counter()
+            active = set()
+            restored_before = mark.last_timestamp - RESTORED_SLACK if mark.last_timestamp else None
+            for row in rows:
+                if restored_before and row["timestamp"] < restored_before:
+                    continue
+                day = timezone.localdate(row["timestamp"])
+                active.add((day, row["session__user_id"]))
+                if row["sender"] == "user":
+                    usage[day]["user_messages"] += 1
+                else:
+                    usage[day]["bot_messages"] += 1
+                    languages[(day, row["detected_language"] or "Unknown")] += 1
+
+            for day, counts in usage.items():
+                increment_daily_usage(day, **counts)
+            for (day, language), n in languages.items():
+                DailyLanguageUsage.objects.get_or_create(date=day, language=language)
+                DailyLanguageUsage.objects.filter(date=day, language=language).update(turns=F("turns") + n)
+            DailyActiveUser.objects.bulk_create(
+                [DailyActiveUser(date=day, user_id=user_id) for day, user_id in active],
+                ignore_conflicts=True
+            )
+            for day in {day for day, _ in active}:
+                DailyUsage.objects.filter(date=day).update(active_users=DailyActiveUser.objects.filter(date=day).count())
+
+            mark.last_id = rows[-1]["id"]
+            # restored rows at the end of a batch carry old timestamps, so take the batch maximum
+            mark.last_timestamp = max(filter(None, [mark.last_timestamp] + [row["timestamp"] for row in rows]))
+            mark.save(update_fields=["last_id", "last_timestamp", "updated_at"])
+        processed += len(rows)
+        if len(rows) < len(batch):
+            return processed
@@ -0,0 +1,120 @@
+import gzip
+import json
+import logging
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, storages
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import ConversationSession, ChatMessage
+
+logger = logging.getLogger(__name__)
+
+# فیلدهایی که در هر خط JSONL ذخیره می‌شوند
+ARCHIVED_FIELDS = [
+    "sender", "message", "detected_language", "original_message",
+    "translated_message", "is_translated", "idempotency_key",
+]
+ARCHIVE_STORAGE = "chat_archive"
+
+
+def archive_name(session):
+    return f"{settings.CHAT_ARCHIVE_PREFIX}/{session.user_id}/{session.session_id}.jsonl.gz"
+
+
+def archive_storage():
+    """
+    Durable storage for new archives (STORAGES["chat_archive"]: S3 or a mounted volume).
+    The container's own disk is not used: a redeploy would lose the only copy of the messages.
+    """
+    if ARCHIVE_STORAGE not in settings.STORAGES:
+        raise ImproperlyConfigured(
+            "Chat archiving needs durable storage: set CHAT_ARCHIVE_S3_BUCKET or CHAT_ARCHIVE_DIR (a mounted volume)"
+        )
+    return storages[ARCHIVE_STORAGE]
+
+
+def stored_archive_storage(name):
+    """Storage holding an existing archive; ones written before STORAGES["chat_archive"] existed are in default_storage."""
+    if ARCHIVE_STORAGE in settings.STORAGES and storages[ARCHIVE_STORAGE].exists(name):
+        return storages[ARCHIVE_STORAGE]
+    return default_storage
+
+
+def archive_session(session):
+    """
+    Move a session's messages into a gzipped JSONL file in the archive storage and delete the rows.
+    The session row stays, so it still appears in the sidebar and is restored when opened.
+    Returns the number of archived messages.
+    """
+    storage = archive_storage()
+    with transaction.atomic():
+        # FOR UPDATE also holds back new messages for the session (their FK check locks the row)
+        session = ConversationSession.objects.select_for_update().get(pk=session.pk)
+        if session.archived_at:
+            return 0
+        lines = []
+        for m in ChatMessage.objects.filter(session=session).order_by("timestamp").iterator():
+            row = {field: getattr(m, field) for field in ARCHIVED_FIELDS}
+            row["timestamp"] = m.timestamp.isoformat()
+            lines.append(json.dumps(row, ensure_ascii=False))
+
+        name = storage.save(archive_name(session), ContentFile(gzip.compress("\n".join(lines).encode("utf-8"))))
+        try:
+            ChatMessage.objects.filter(session=session).delete()
+            session.archived_at = timezone.now()
+            session.archive_name = name
+            session.save(update_fields=["archived_at", "archive_name"])
+        except Exception:
+            storage.delete(name)
+            raise
+    return len(lines)
+
+
+def read_archive(session):
+    """Yield the archived message dicts of a session, one line at a time."""
+    with stored_archive_storage(session.archive_name).open(session.archive_name, "rb") as f, gzip.open(f, "rt", encoding="utf-8") as lines:
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
+
+def restore_session(session):
+    """
+    Load an archived session's messages back into the table and remove the archive file.
+    Safe to call concurrently: the session row is locked and re-checked, so only one caller restores.
+    """
+    if not session.archived_at:
+        return 0
+
+    with transaction.atomic():
+        locked = ConversationSession.objects.select_for_update().get(pk=session.pk)
+        if locked.archived_at:
+            rows = list(read_archive(locked))
+            timestamps = [parse_datetime(row.pop("timestamp")) for row in rows]
+            restored = ChatMessage.objects.bulk_create([ChatMessage(session=locked, **row) for row in rows])
+            # auto_now_add در bulk_create زمان را بازنویسی می‌کند؛ زمان اصلی را برگردان
+            for m, ts in zip(restored, timestamps):
+                m.timestamp = ts
+            ChatMessage.objects.bulk_update(restored, ["timestamp"], batch_size=500)
+            name, storage = locked.archive_name, stored_archive_storage(locked.archive_name)
+            locked.archived_at = None
+            locked.archive_name = None
+            locked.save(update_fields=["archived_at", "archive_name"])
+            transaction.on_commit(lambda: storage.delete(name))
+            logger.info(f"Restored {len(restored)} messages for session {locked.session_id}")
+        else:
+            # یک درخواست هم‌زمان زودتر برگرداند
+            restored = []
+    session.archived_at = None
+    session.archive_name = None
+    return len(restored)
+
+
+def delete_archive(session):
+    if session.archive_name:
+        storage = stored_archive_storage(session.archive_name)
+        if storage.exists(session.archive_name):
+            storage.delete(session.archive_name)
@@ -0,0 +1,117 @@
+import logging
+import httpx
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from .models import ConversationSession, ChatMessage
+from .ai_turns import build_ai_payload, learn_session_language, save_user_message, store_bot_reply, stream_ai_reply
+from .archive import restore_session
+from .ratelimit import take_token
+from .analytics import record_ai_error
+
+logger = logging.getLogger(__name__)
+
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    One socket per open chat page. The user and ConversationSession are resolved once on connect;
+    each message then streams typing state, bot tokens and a final `done` event with the stored reply.
+    Messages on one socket are handled in order, so a socket has at most one turn in flight.
+    """
+
+    async def connect(self):
+        user = self.scope["user"]
+        if not user.is_authenticated:
+            await self.close()
+            return
+        session_id = self.scope["url_route"]["kwargs"]["session_id"]
+        self.chat_session = await database_sync_to_async(
+            ConversationSession.objects.filter(user=user, session_id=session_id).first
+        )()
+        if self.chat_session is None:
+            await self.close()
+            return
+        if self.chat_session.archived_at:
+            await database_sync_to_async(restore_session)(self.chat_session)
+        await self.accept()
+
+    async def receive_json(self, content, **kwargs):
+        user_text = (content.get("message") or "").strip()
+        idempotency_key = (content.get("idempotency_key") or "").strip()[:64] or None
+        if not user_text:
+            await self.send_json({"type": "error", "error": "Empty message"})
+            return
+
+        user_message, created = await database_sync_to_async(save_user_message)(
+            self.chat_session, user_text, idempotency_key
+        )
+        if user_message is None:
+            await self.send_json({"type": "error", "error": "This message could not be sent, please send it again"})
+            return
+        if not created:
+            await self.send_replay(idempotency_key)
+            return
+        allowed, retry_after = await database_sync_to_async(take_token)(self.scope["user"].id)
+        if not allowed:
+            await database_sync_to_async(user_message.delete)()
+            await self.send_json({"type": "error", "error": "Too many messages, please slow down", "retry_after": retry_after})
+            return
+
+        await self.send_json({"type": "typing", "state": True})
+        bot_message = None
+        try:
+            payload = await database_sync_to_async(build_ai_payload)(self.chat_session, user_text)
+            async for event in stream_ai_reply(payload):
+                if event.get("type") == "token":
+                    await self.send_json({"type": "token", "text": event.get("text", "")})
+                elif event.get("type") == "done":
+                    await database_sync_to_async(learn_session_language)(self.chat_session, event)
+                    bot_message = await database_sync_to_async(store_bot_reply)(
+                        self.chat_session,
+                        user_message,
+                        event.get("answer", "No reply"),
+                        event.get("detected_language", "English"),
+                        idempotency_key
+                    )
+                    await self.send_json({
+                        "type": "done",
+                        "ai_reply": bot_message.message,
+                        "detected_language": bot_message.detected_language
+                    })
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 429:
+                await self.fail_turn(user_message, bot_message, e)
+                return
+            # ai_app is busy: not an AI error; like chatbot_main, drop the message so a retry stores it again
+            await database_sync_to_async(user_message.delete)()
+            await self.send_json({
+                "type": "error",
+                "error": "The assistant is busy, please try again",
+                "retry_after": int(e.response.headers.get("Retry-After", 1))
+            })
+        except Exception as e:
+            await self.fail_turn(user_message, bot_message, e)
+        finally:
+            await self.send_json({"type": "typing", "state": False})
+
+    async def fail_turn(self, user_message, bot_message, error):
+        # the exception text may contain ai_app's URL; it goes to the log, not to the browser
+        logger.warning(f"Streaming turn failed for session {self.chat_session.session_id}: {error}")
+        await database_sync_to_async(record_ai_error)()
+        if bot_message is None:
+            # retry with the same idempotency key should store the message again, not replay "in progress"
+            await database_sync_to_async(user_message.delete)()
+        await self.send_json({"type": "done", "ai_reply": "[Error] The assistant could not reply, please try again.", "detected_language": None})
+
+    async def send_replay(self, idempotency_key):
+        bot_message = await database_sync_to_async(
+            ChatMessage.objects.filter(session=self.chat_session, sender="bot", idempotency_key=idempotency_key).first
+        )()
+        if bot_message is None:
+            await self.send_json({"type": "error", "error": "This message is already being processed"})
+            return
+        await self.send_json({
+            "type": "done",
+            "ai_reply": bot_message.message,
+            "detected_language": bot_message.detected_language,
+            "replayed": True
+        })
@@ -0,0 +1,100 @@
+import csv
+import itertools
+import json
+from asgiref.sync import sync_to_async
+from .archive import read_archive
+from .models import ConversationSession, ChatMessage
+
+EXPORT_FORMATS = {
+    "jsonl": "application/x-ndjson",
+    "csv": "text/csv",
+}
+CSV_COLUMNS = [
+    "session_id", "session_created_at", "sender", "timestamp",
+    "detected_language", "message", "original_message", "translated_message",
+]
+MESSAGE_FIELDS = ["sender", "message", "timestamp", "detected_language", "original_message", "translated_message"]
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object whose write() returns the value, so csv.writer can feed a generator."""
+
+    def write(self, value):
+        return value
+
+
+def iter_conversations(user):
+    """
+    Yield (session, message dicts) for all of a user's sessions, oldest first.
+    Rows come from server-side cursors (.iterator()); archived sessions are read from their archive file.
+    """
+    for session in ConversationSession.objects.filter(user=user).order_by("created_at").iterator(chunk_size=CHUNK_SIZE):
+        if session.archived_at:
+            messages = read_archive(session)
+        else:
+            messages = (
+                ChatMessage.objects.filter(session=session)
+                .order_by("timestamp")
+                .values(*MESSAGE_FIELDS)
+                .iterator(chunk_size=CHUNK_SIZE)
+            )
+        yield session, messages
+
+
+def _isoformat(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def _original_text(m):
+    """ChatMessage.original_text for a values()/archive row: a NULL original_message means it equals `message`."""
+    return m.get("original_message") if m.get("original_message") is not None else m.get("message")
+
+
+def export_jsonl(user):
+    """One `session` line per session, followed by its `message` lines."""
+    for session, messages in iter_conversations(user):
+        yield json.dumps({
+            "type": "session",
+            "session_id": str(session.session_id),
+            "created_at": session.created_at.isoformat(),
+            "user_language": session.user_language,
+        }, ensure_ascii=False) + "\n"
+        for m in messages:
+            row = {"type": "message", "session_id": str(session.session_id)}
+            row.update({field: _isoformat(m.get(field)) for field in MESSAGE_FIELDS})
+            row["original_message"] = _original_text(m)
+            yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def export_csv(user):
+    """One row per message (CSV_COLUMNS)."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for session, messages in iter_conversations(user):
+        for m in messages:
+            yield writer.writerow([
+                session.session_id, session.created_at.isoformat(), m.get("sender"), _isoformat(m.get("timestamp")),
+                m.get("detected_language"), m.get("message"), _original_text(m), m.get("translated_message"),
+            ])
+
+
+def export_conversations(user, fmt):
+    return export_csv(user) if fmt == "csv" else export_jsonl(user)
+
+
+async def aiter_chunks(lines, batch=500):
+    """
+    Async wrapper for ASGI: Django buffers sync iterators under ASGI, so pull `batch` lines
+    at a time on the DB thread (server-side cursors stay on one connection).
+    """
+    lines = iter(lines)
+
+    def take():
+        return "".join(itertools.islice(lines, batch))
+
+    while True:
+        chunk = await sync_to_async(take, thread_sensitive=True)()
+        if not chunk:
+            break
+        yield chunk
@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.utils import timezone
+
+from home_page.archive import archive_session, archive_storage, restore_session
+from home_page.models import ConversationSession
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive chat sessions idle for N days into gzipped JSONL files, or restore archived sessions. "
+        "Archiving needs durable storage: CHAT_ARCHIVE_S3_BUCKET or CHAT_ARCHIVE_DIR (see settings)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.CHAT_ARCHIVE_AFTER_DAYS,
+                            help="Archive sessions whose last message is older than this")
+        parser.add_argument("--limit", type=int, default=500, help="Max sessions to archive in one run")
+        parser.add_argument("--dry-run", action="store_true")
+        parser.add_argument("--restore", nargs="+", metavar="SESSION_ID",
+                            help="Restore these sessions instead of archiving")
+
+    def handle(self, *args, **options):
+        if options["restore"]:
+            for session_id in options["restore"]:
+                session = ConversationSession.objects.filter(session_id=session_id).first()
+                if session is None:
+                    raise CommandError(f"No session {session_id}")
+                self.stdout.write(f"{session_id}: restored {restore_session(session)} messages")
+            return
+
+        try:
+            archive_storage()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        # جلسه‌هایی که job باز دارند بایگانی نمی‌شوند
+        idle = (
+            ConversationSession.objects.filter(archived_at__isnull=True)
+            .annotate(last_message=Max("messages__timestamp"))
+            .filter(last_message__lt=cutoff)
+            .exclude(jobs__status__in=["pending", "running"])
+            .order_by("last_message")[:options["limit"]]
+        )
+
+        sessions = messages = 0
+        for session in idle:
+            if options["dry_run"]:
+                self.stdout.write(f"Would archive {session.session_id} (last message {session.last_message:%Y-%m-%d})")
+                continue
+            messages += archive_session(session)
+            sessions += 1
+        if not options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"Archived {sessions} sessions ({messages} messages)"))
@@ -0,0 +1,71 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from home_page.models import ConversationSession, ChatMessage
+from home_page.search import search_messages
+
+WORDS = (
+    "exam grade course credit library campus tuition deadline professor lecture semester "
+    "scholarship housing visa enrollment thesis schedule transcript internship advisor "
+    "registration payment refund portal email password laboratory assignment project"
+).split()
+LANGUAGES = ["English", "English", "English", "de", "fr", "fa"]
+
+
+class Command(BaseCommand):
+    help = "Load synthetic chat messages and report search latency (p50/p95) for one user among many."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=1_000_000, help="Synthetic messages to create")
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--keep", action="store_true", help="Keep the synthetic data afterwards")
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        users = [
+            User.objects.create_user(username=f"bench_search_{i}", email=f"bench_search_{i}@example.invalid")
+            for i in range(options["users"])
+        ]
+        sessions = ConversationSession.objects.bulk_create(
+            [ConversationSession(user=u) for u in users for _ in range(5)]
+        )
+
+        started = time.perf_counter()
+        created = 0
+        while created < options["messages"]:
+            n = min(options["batch_size"], options["messages"] - created)
+            ChatMessage.objects.bulk_create([
+                ChatMessage(
+                    session=rng.choice(sessions),
+                    sender=rng.choice(["user", "bot"]),
+                    message=" ".join(rng.choices(WORDS, k=rng.randint(6, 40))),
+                    detected_language=rng.choice(LANGUAGES),
+                )
+                for _ in range(n)
+            ])
+            created += n
+        load_s = time.perf_counter() - started
+        self.stdout.write(f"Loaded {created} messages in {load_s:.1f}s ({created / load_s:.0f} rows/s)")
+
+        latencies = []
+        for _ in range(options["queries"]):
+            user = rng.choice(users)
+            query = " ".join(rng.sample(WORDS, rng.randint(1, 2)))
+            t = time.perf_counter()
+            search_messages(user, query, page=rng.randint(1, 3))
+            latencies.append((time.perf_counter() - t) * 1000)
+        latencies.sort()
+        self.stdout.write(self.style.SUCCESS(
+            f"search latency over {len(latencies)} queries: "
+            f"p50={statistics.median(latencies):.1f}ms "
+            f"p95={latencies[int(len(latencies) * 0.95) - 1]:.1f}ms max={latencies[-1]:.1f}ms"
+        ))
+
+        if not options["keep"]:
+            User.objects.filter(username__startswith="bench_search_").delete()
@@ -0,0 +1,58 @@
+import re
+from pathlib import Path
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from home_page.templatetags.icons import ICON_SPRITE
+
+# Font Awesome 5 names used in the templates → their Font Awesome 6 file names
+FA6_NAMES = {
+    "plus-circle": "circle-plus",
+    "id-card-alt": "id-card-clip",
+    "sign-out-alt": "right-from-bracket",
+    "file-upload": "file-arrow-up",
+}
+ICON_USAGE = re.compile(r"""{%\s*icon\s+["']([a-z0-9-]+)["']""")
+VIEWBOX = re.compile(r'viewBox="([^"]+)"')
+SVG_BODY = re.compile(r"<svg[^>]*>(.*)</svg>", re.S)
+COMMENT = re.compile(r"<!--.*?-->", re.S)
+
+
+class Command(BaseCommand):
+    help = "Write an SVG sprite with only the Font Awesome icons used by {% icon %} in home_page templates."
+
+    def handle(self, *args, **options):
+        try:
+            import fontawesomefree
+        except ImportError:
+            raise CommandError("fontawesomefree is not installed (see requirements.txt)")
+        svg_dir = Path(fontawesomefree.__file__).parent / "static" / "fontawesomefree" / "svgs" / "solid"
+
+        app_dir = Path(apps.get_app_config("home_page").path)
+        used = sorted({
+            name
+            for template in (app_dir / "templates").rglob("*.html")
+            for name in ICON_USAGE.findall(template.read_text(encoding="utf-8"))
+        })
+
+        symbols = []
+        for name in used:
+            source = svg_dir / f"{FA6_NAMES.get(name, name)}.svg"
+            if not source.exists():
+                raise CommandError(f"No Font Awesome icon for {name} ({source.name})")
+            svg = COMMENT.sub("", source.read_text(encoding="utf-8"))
+            symbols.append(
+                f'<symbol id="{name}" viewBox="{VIEWBOX.search(svg).group(1)}">{SVG_BODY.search(svg).group(1).strip()}</symbol>'
+            )
+
+        target = app_dir / "static" / ICON_SPRITE
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(
+            '<svg xmlns="http://www.w3.org/2000/svg" style="display:none">'
+            "<!-- Font Awesome Free by @fontawesome - https://fontawesome.com License - https://fontawesome.com/license/free -->"
+            + "".join(symbols)
+            + "</svg>\n",
+            encoding="utf-8",
+        )
+        self.stdout.write(f"Wrote {len(symbols)} icons to {target}: {', '.join(used)}")
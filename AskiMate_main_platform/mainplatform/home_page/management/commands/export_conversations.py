@@ -0,0 +1,29 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from home_page.accounts import users_with_email
+from home_page.export import EXPORT_FORMATS, export_conversations
+
+
+class Command(BaseCommand):
+    help = "Stream a user's sessions and messages as JSONL or CSV (for support requests)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("user", help="Username or email")
+        parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="jsonl")
+        parser.add_argument("--output", "-o", help="File to write (default: stdout)")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options["user"]).first() or users_with_email(options["user"]).first()
+        if user is None:
+            raise CommandError(f"No user {options['user']}")
+
+        out = open(options["output"], "w", encoding="utf-8", newline="") if options["output"] else sys.stdout
+        try:
+            for line in export_conversations(user, options["format"]):
+                out.write(line)
+        finally:
+            if out is not sys.stdout:
+                out.close()
@@ -0,0 +1,75 @@
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models.functions import Lower
+
+
+def hash_password(password):
+    """Keep values that are already Django hashes (pre-hashed exports); hash plain text."""
+    try:
+        identify_hasher(password)
+        return password
+    except ValueError:
+        return make_password(password)
+
+
+class Command(BaseCommand):
+    help = "Bulk-create accounts from a CSV with Username, Email, Password columns (e.g. user_data.csv)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--hash-workers", type=int, default=os.cpu_count(),
+                            help="Processes hashing plain-text passwords (PBKDF2 is CPU-bound)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        created = skipped = 0
+
+        with open(options["path"], newline="", encoding="utf-8-sig") as f, \
+                ProcessPoolExecutor(max_workers=options["hash_workers"]) as pool:
+            rows = (
+                {k.strip().lower(): (v or "").strip() for k, v in row.items() if k}
+                for row in csv.DictReader(f)
+            )
+            while batch := list(islice(rows, options["batch_size"])):
+                # ردیف ناقص، تکراری داخل فایل یا موجود در دیتابیس رد می‌شود
+                seen_usernames, seen_emails, fresh = set(), set(), []
+                for row in batch:
+                    username, email = row.get("username"), row.get("email", "").lower()
+                    if not (username and email and row.get("password")) or username in seen_usernames or email in seen_emails:
+                        skipped += 1
+                        continue
+                    seen_usernames.add(username)
+                    seen_emails.add(email)
+                    fresh.append((username, email, row["password"]))
+
+                taken_usernames = set(User.objects.filter(username__in=seen_usernames).values_list("username", flat=True))
+                taken_emails = set(
+                    User.objects.exclude(email="").annotate(email_lower=Lower("email")).filter(email_lower__in=seen_emails)
+                    .values_list("email_lower", flat=True)
+                )
+                new_rows = [r for r in fresh if r[0] not in taken_usernames and r[1] not in taken_emails]
+                skipped += len(fresh) - len(new_rows)
+                fresh = new_rows
+
+                hashes = pool.map(hash_password, [r[2] for r in fresh], chunksize=32)
+                users = [User(username=u, email=e, password=h) for (u, e, _), h in zip(fresh, hashes)]
+                with transaction.atomic():
+                    User.objects.bulk_create(users, batch_size=options["batch_size"])
+                created += len(users)
+
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"{created} created, {skipped} skipped ({created / elapsed:.0f} rows/s)")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {created} users in {elapsed:.1f}s ({created / elapsed if elapsed else 0:.0f} rows/s), skipped {skipped}"
+        ))
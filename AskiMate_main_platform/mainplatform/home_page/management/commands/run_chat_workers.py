@@ -0,0 +1,144 @@
+import logging
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from home_page.ai_turns import run_ai_turn
+from home_page.analytics import record_ai_error
+from home_page.models import ChatJob
+
+logger = logging.getLogger(__name__)
+
+WORKER_RETRY_DELAY = 5  # seconds
+
+
+def claim_next_job():
+    """Atomically move the oldest due pending job to `running`; None if the queue is empty."""
+    with transaction.atomic():
+        job = (
+            ChatJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(run_after__isnull=True) | Q(run_after__lte=timezone.now()), status="pending")
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = "running"
+        job.started_at = timezone.now()
+        job.attempts += 1
+        job.save(update_fields=["status", "started_at", "attempts"])
+    return job
+
+
+def process_job(job, max_attempts):
+    user_message = job.user_message
+    try:
+        bot_message = run_ai_turn(job.session, user_message, user_message.idempotency_key)
+    except requests.HTTPError as e:
+        if e.response is None or e.response.status_code != 429:
+            fail_attempt(job, e, max_attempts)
+            return
+        # ai_app is busy: wait for its Retry-After; not a failed attempt
+        retry_after = int(e.response.headers.get("Retry-After", WORKER_RETRY_DELAY))
+        logger.info(f"Chat job {job.job_id} rate limited by ai_app, retrying in {retry_after}s")
+        job.status = "pending"
+        job.attempts -= 1
+        job.run_after = timezone.now() + timedelta(seconds=retry_after)
+        job.save(update_fields=["status", "attempts", "run_after"])
+        return
+    except Exception as e:
+        fail_attempt(job, e, max_attempts)
+        return
+    job.bot_message = bot_message
+    job.status = "done"
+    job.finished_at = timezone.now()
+    job.save(update_fields=["bot_message", "status", "finished_at"])
+
+
+def fail_attempt(job, error, max_attempts):
+    """Requeue the job, or mark it failed after max_attempts; a failed job's message is left out of the AI history."""
+    logger.warning(f"Chat job {job.job_id} attempt {job.attempts} failed: {error}")
+    job.error = str(error)
+    job.status = "pending" if job.attempts < max_attempts else "failed"
+    job.finished_at = timezone.now() if job.status == "failed" else None
+    job.save(update_fields=["status", "error", "finished_at"])
+    if job.status == "failed":
+        record_ai_error()
+
+
+def requeue_stale_jobs(stale_after, max_attempts):
+    """
+    Jobs left `running` by a crashed or killed worker go back to `pending`. Each claim counts an
+    attempt, so a job that keeps taking its worker down is failed after max_attempts like any other.
+    """
+    stale = ChatJob.objects.filter(status="running", started_at__lt=timezone.now() - timedelta(seconds=stale_after))
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status="failed", error="Worker stopped while running the job", finished_at=timezone.now()
+    )
+    requeued = stale.filter(attempts__lt=max_attempts).update(status="pending")
+    if failed:
+        record_ai_error(failed)
+    if failed or requeued:
+        logger.warning(f"Stale chat jobs: {requeued} requeued, {failed} failed")
+
+
+class Command(BaseCommand):
+    help = "Run a pool of workers that take queued chat turns (ChatJob) and call ai_app."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Concurrent ai_app calls")
+        parser.add_argument("--poll-interval", type=float, default=0.5, help="Seconds to sleep when the queue is empty")
+        parser.add_argument("--max-attempts", type=int, default=2)
+        parser.add_argument("--stale-after", type=int, default=300,
+                            help="Requeue jobs stuck in `running` for this many seconds (crashed worker)")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        # SIGTERM (redeploy, scale down) stops like Ctrl-C: each worker finishes its current job first
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        self.stdout.write(f"Starting {options['workers']} chat workers")
+
+        def worker_loop():
+            while not stop.is_set():
+                try:
+                    close_old_connections()
+                    job = claim_next_job()
+                    if job is None:
+                        stop.wait(options["poll_interval"])
+                        continue
+                    process_job(job, options["max_attempts"])
+                except Exception:
+                    # DB unavailable etc.: drop the connection and retry instead of losing the thread;
+                    # a job left in `running` is requeued as stale
+                    logger.exception("Chat worker error, retrying")
+                    connection.close()
+                    stop.wait(WORKER_RETRY_DELAY)
+
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            futures = [pool.submit(worker_loop) for _ in range(options["workers"])]
+            next_requeue = 0
+            try:
+                while not stop.is_set():
+                    for i, future in enumerate(futures):
+                        if future.done():
+                            logger.error("Chat worker exited, restarting it", exc_info=future.exception())
+                            futures[i] = pool.submit(worker_loop)
+                    if time.monotonic() >= next_requeue:
+                        next_requeue = time.monotonic() + options["stale_after"] / 2
+                        try:
+                            requeue_stale_jobs(options["stale_after"], options["max_attempts"])
+                        except Exception:
+                            logger.exception("Could not requeue stale chat jobs")
+                            connection.close()
+                    stop.wait(WORKER_RETRY_DELAY)
+            except KeyboardInterrupt:
+                stop.set()
+        self.stdout.write("Chat workers stopped")
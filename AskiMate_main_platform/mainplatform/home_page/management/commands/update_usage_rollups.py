@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from home_page.analytics import update_rollups
+
+
+class Command(BaseCommand):
+    help = "Fold new ChatMessages (past the watermark) into the daily usage rollups."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--every", type=int, default=0,
+                            help="Keep running and update every N seconds (0 = run once)")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            processed = update_rollups(batch_size=options["batch_size"])
+            self.stdout.write(f"Rolled up {processed} messages")
+            if not options["every"]:
+                return
+            time.sleep(options["every"])
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2025-09-20 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home_page', '0009_alter_conversationsession_user_language'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='idempotency_key',
+            field=models.CharField(blank=True, help_text='Client-generated key used to dedupe retried sends', max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='chatmessage',
+            constraint=models.UniqueConstraint(fields=('session', 'sender', 'idempotency_key'), name='unique_chatmessage_idempotency_key'),
+        ),
+    ]
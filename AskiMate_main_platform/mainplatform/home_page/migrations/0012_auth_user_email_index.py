@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2025-09-27 11:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Originally created a case-sensitive unique index on auth_user.email, which fails on
+    databases with duplicate emails. Superseded by 0017_auth_user_email_lower_index, which
+    checks for duplicates first (listing them for a manual merge) and indexes lower(email);
+    kept empty so the migration graph is unchanged.
+    """
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('home_page', '0011_chatjob'),
+    ]
+
+    operations = []
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.4 on 2025-09-28 10:20
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+from django.db.models import F
+
+BATCH_SIZE = 10000
+
+
+def drop_duplicate_original_message(apps, schema_editor):
+    # original_message فقط وقتی نگه داشته می‌شود که با message فرق کند
+    # migration اتمیک نیست، پس هر batch تراکنش خودش را دارد
+    ChatMessage = apps.get_model('home_page', 'ChatMessage')
+    last_id = ChatMessage.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    for start in range(0, last_id + 1, BATCH_SIZE):
+        ChatMessage.objects.filter(
+            id__gte=start, id__lt=start + BATCH_SIZE, original_message=F('message')
+        ).update(original_message=None)
+
+
+class AddPostgresIndex(AddIndexConcurrently):
+    """
+    CREATE INDEX CONCURRENTLY on Postgres, so writes to the table are not blocked while it builds;
+    a no-op on the local SQLite database (BRIN is Postgres-only).
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+    # CONCURRENTLY and the batched backfill both need to run outside one migration transaction
+    atomic = False
+
+    dependencies = [
+        ('home_page', '0012_auth_user_email_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationsession',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversationsession',
+            name='archive_name',
+            field=models.CharField(blank=True, help_text='Storage path of the archived messages', max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='original_message',
+            field=models.TextField(blank=True, help_text='Original message before translation; empty when it equals message', null=True),
+        ),
+        AddPostgresIndex(
+            model_name='chatmessage',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['timestamp'], name='chatmessage_timestamp_brin'),
+        ),
+        migrations.RunPython(drop_duplicate_original_message, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,120 @@
+# Generated by Django 5.2.4 on 2025-09-29 14:30
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 10000
+
+# home_page.search.SEARCH_CONFIGS در زمان این migration
+SEARCH_CONFIGS = {
+    "english": "english", "en": "english",
+    "ar": "arabic", "da": "danish", "de": "german", "el": "greek", "es": "spanish",
+    "fi": "finnish", "fr": "french", "hu": "hungarian", "id": "indonesian", "it": "italian",
+    "nl": "dutch", "no": "norwegian", "pt": "portuguese", "ro": "romanian", "ru": "russian",
+    "sv": "swedish", "tr": "turkish",
+}
+
+POSTGRES_FORWARD = [
+    "ALTER TABLE home_page_chatmessage ADD COLUMN search_config varchar(32) NOT NULL DEFAULT 'simple';",
+    "ALTER TABLE home_page_chatmessage ADD COLUMN search_vector tsvector;",
+    """
+    CREATE OR REPLACE FUNCTION home_page_chatmessage_search_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_config := CASE lower(coalesce(NEW.detected_language, ''))
+            %s
+            ELSE 'simple' END;
+        NEW.search_vector := to_tsvector(NEW.search_config::regconfig, coalesce(NEW.message, ''));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """ % "\n            ".join(f"WHEN '{code}' THEN '{config}'" for code, config in SEARCH_CONFIGS.items()),
+    """
+    CREATE TRIGGER home_page_chatmessage_search
+    BEFORE INSERT OR UPDATE OF message, detected_language ON home_page_chatmessage
+    FOR EACH ROW EXECUTE FUNCTION home_page_chatmessage_search_update();
+    """,
+]
+
+POSTGRES_BACKWARD = [
+    "DROP TRIGGER IF EXISTS home_page_chatmessage_search ON home_page_chatmessage;",
+    "DROP FUNCTION IF EXISTS home_page_chatmessage_search_update();",
+    "DROP INDEX IF EXISTS chatmessage_search_vector_gin;",
+    "ALTER TABLE home_page_chatmessage DROP COLUMN IF EXISTS search_vector;",
+    "ALTER TABLE home_page_chatmessage DROP COLUMN IF EXISTS search_config;",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE home_page_chatmessage_fts USING fts5(
+        message, content='home_page_chatmessage', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    );
+    """,
+    """
+    CREATE TRIGGER home_page_chatmessage_fts_ai AFTER INSERT ON home_page_chatmessage BEGIN
+        INSERT INTO home_page_chatmessage_fts(rowid, message) VALUES (new.id, new.message);
+    END;
+    """,
+    """
+    CREATE TRIGGER home_page_chatmessage_fts_ad AFTER DELETE ON home_page_chatmessage BEGIN
+        INSERT INTO home_page_chatmessage_fts(home_page_chatmessage_fts, rowid, message) VALUES ('delete', old.id, old.message);
+    END;
+    """,
+    """
+    CREATE TRIGGER home_page_chatmessage_fts_au AFTER UPDATE OF message ON home_page_chatmessage BEGIN
+        INSERT INTO home_page_chatmessage_fts(home_page_chatmessage_fts, rowid, message) VALUES ('delete', old.id, old.message);
+        INSERT INTO home_page_chatmessage_fts(rowid, message) VALUES (new.id, new.message);
+    END;
+    """,
+    "INSERT INTO home_page_chatmessage_fts(home_page_chatmessage_fts) VALUES ('rebuild');",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS home_page_chatmessage_fts_ai;",
+    "DROP TRIGGER IF EXISTS home_page_chatmessage_fts_ad;",
+    "DROP TRIGGER IF EXISTS home_page_chatmessage_fts_au;",
+    "DROP TABLE IF EXISTS home_page_chatmessage_fts;",
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        # ستون‌ها و trigger با هم، در یک تراکنش
+        with transaction.atomic(using=schema_editor.connection.alias):
+            for sql in POSTGRES_FORWARD:
+                schema_editor.execute(sql)
+        # پر کردن ستون‌ها برای ردیف‌های قبلی؛ UPDATE روی detected_language trigger را اجرا می‌کند
+        # migration اتمیک نیست، پس هر batch جدا commit می‌شود
+        ChatMessage = apps.get_model('home_page', 'ChatMessage')
+        last_id = ChatMessage.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        for start in range(0, last_id + 1, BATCH_SIZE):
+            schema_editor.execute(
+                "UPDATE home_page_chatmessage SET detected_language = detected_language WHERE id >= %s AND id < %s",
+                [start, start + BATCH_SIZE],
+            )
+        schema_editor.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS chatmessage_search_vector_gin ON home_page_chatmessage USING gin (search_vector);"
+        )
+    elif vendor == "sqlite":
+        with transaction.atomic(using=schema_editor.connection.alias):
+            for sql in SQLITE_FORWARD:
+                schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for sql in {"postgresql": POSTGRES_BACKWARD, "sqlite": SQLITE_BACKWARD}.get(vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+    """Search columns, trigger and index live only in the database; see home_page/search.py."""
+    # the backfill commits batch by batch and the GIN index is built CONCURRENTLY
+    atomic = False
+
+    dependencies = [
+        ('home_page', '0013_chat_message_compaction'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2025-10-02 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home_page', '0015_usage_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationsession',
+            name='language_confirmed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.4 on 2025-10-03 10:05
+
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+def check_duplicate_emails(apps, schema_editor):
+    """
+    The unique index can't be built while accounts share an email ignoring case (e.g. a Google
+    login created next to a local account). Such accounts are not changed here: the migration
+    stops and lists them so they can be merged by hand, then it can be run again.
+    """
+    User = apps.get_model('auth', 'User')
+    duplicated = list(
+        User.objects.exclude(email='').annotate(email_lower=Lower('email'))
+        .values('email_lower').annotate(n=Count('id')).filter(n__gt=1)
+        .values_list('email_lower', flat=True)
+    )
+    if not duplicated:
+        return
+    conflicts = []
+    for email in duplicated:
+        ids = (
+            User.objects.exclude(email='').annotate(email_lower=Lower('email')).filter(email_lower=email)
+            .order_by('id').values_list('id', flat=True)
+        )
+        conflicts.append(f"{email}: auth_user ids {', '.join(str(i) for i in ids)}")
+    raise RuntimeError(
+        "Accounts share an email (ignoring case); merge them before creating auth_user_email_lower_uniq:\n  "
+        + "\n  ".join(conflicts)
+    )
+
+
+class Migration(migrations.Migration):
+    """
+    Unique index on lower(auth_user.email) for the email login lookup; blank emails
+    (e.g. createsuperuser) are left out. This is what a conditional UniqueConstraint on
+    Lower('email') compiles to; auth.User belongs to another app, so it is created with SQL.
+    """
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('home_page', '0016_conversationsession_language_confirmed'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.RunSQL(
+            sql=[
+                # case-sensitive index from the original 0012
+                "DROP INDEX IF EXISTS auth_user_email_uniq;",
+                "CREATE UNIQUE INDEX IF NOT EXISTS auth_user_email_lower_uniq ON auth_user (lower(email)) WHERE email <> '';",
+            ],
+            reverse_sql="DROP INDEX IF EXISTS auth_user_email_lower_uniq;",
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2025-10-05 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home_page', '0017_auth_user_email_lower_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatjob',
+            name='run_after',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.contrib.postgres.indexes import BrinIndex
 from django.contrib.auth.models import User
 import uuid
 
@@ -6,7 +7,12 @@ class ConversationSession(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations')
     session_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     user_language = models.CharField(max_length=255, default='English', help_text='User preferred language')
+    # True once ai_app detected user_language with enough confidence; it is then sent as a hint
+    language_confirmed = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # سشن‌های بایگانی‌شده: پیام‌ها در فایل gzip JSONL هستند (home_page.archive)
+    archived_at = models.DateTimeField(blank=True, null=True, db_index=True)
+    archive_name = models.CharField(max_length=255, blank=True, null=True, help_text='Storage path of the archived messages')
 
     def __str__(self):
         return f"Session {self.session_id} ({self.user.email})"
@@ -18,9 +24,106 @@ class ChatMessage(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     # فیلدهای اختیاری برای ذخیره زبان (در صورت نیاز)
     detected_language = models.CharField(max_length=255, blank=True, null=True, help_text='Detected language of the message')
-    original_message = models.TextField(blank=True, null=True, help_text='Original message before translation')
+    original_message = models.TextField(blank=True, null=True, help_text='Original message before translation; empty when it equals message')
     translated_message = models.TextField(blank=True, null=True, help_text='Translated message')
     is_translated = models.BooleanField(default=False)  # اضافه کردن default=False
+    idempotency_key = models.CharField(max_length=64, blank=True, null=True, help_text='Client-generated key used to dedupe retried sends')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'sender', 'idempotency_key'], name='unique_chatmessage_idempotency_key'),
+        ]
+        indexes = [
+            # جدول فقط به ترتیب زمان append می‌شود؛ BRIN خیلی کوچک است و اسکن‌های بازه‌ی زمانی را محدود می‌کند
+            BrinIndex(fields=['timestamp'], name='chatmessage_timestamp_brin'),
+        ]
+
+    def __str__(self):
+        return f"{self.sender} said '{self.message[:24]}'"
+
+    @property
+    def original_text(self):
+        return self.original_message if self.original_message is not None else self.message
+
+
+class ChatJob(models.Model):
+    """A queued AI turn: the user message is stored, the bot reply is written by a chat worker."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    job_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    session = models.ForeignKey(ConversationSession, on_delete=models.CASCADE, related_name='jobs')
+    user_message = models.OneToOneField(ChatMessage, on_delete=models.CASCADE, related_name='job')
+    bot_message = models.OneToOneField(ChatMessage, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='pending', db_index=True)
+    error = models.TextField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # not claimed before this time (set when ai_app answered 429 with Retry-After)
+    run_after = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Job {self.job_id} ({self.status})"
+
+
+# آمار روزانه (rollup)؛ توسط `manage.py update_usage_rollups` و home_page/analytics.py پر می‌شوند
+class DailyUsage(models.Model):
+    date = models.DateField(unique=True)
+    user_messages = models.PositiveIntegerField(default=0)
+    bot_messages = models.PositiveIntegerField(default=0)
+    ai_errors = models.PositiveIntegerField(default=0, help_text='Failed AI turns ([Error] replies and failed chat jobs)')
+    active_users = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = 'daily usage'
+
+    @property
+    def error_rate(self):
+        turns = self.bot_messages + self.ai_errors
+        return self.ai_errors / turns if turns else 0.0
+
+    def __str__(self):
+        return f"Usage {self.date}"
+
+
+class DailyLanguageUsage(models.Model):
+    """Answered turns per day and detected_language (taken from the bot message of each turn)."""
+    date = models.DateField()
+    language = models.CharField(max_length=255)
+    turns = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'language'], name='unique_daily_language'),
+        ]
+
+    def __str__(self):
+        return f"{self.language} on {self.date}"
+
+
+class DailyActiveUser(models.Model):
+    date = models.DateField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'user'], name='unique_daily_active_user'),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """Last ChatMessage already counted into the rollups, per rollup job."""
+    name = models.CharField(max_length=64, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    last_timestamp = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"{self.sender} said '{self.message[:24]}'"
\ No newline at end of file
+        return f"{self.name} @ {self.last_id}"
@@ -0,0 +1,17 @@
+from social_core.exceptions import AuthException
+from .accounts import users_with_email
+
+
+def reject_taken_email(backend, details, user=None, *args, **kwargs):
+    """
+    Social auth pipeline step before create_user: a first Google login whose email already belongs
+    to an account is stopped instead of creating a second user with that email (auth_user_email_lower_uniq).
+    The account is not linked automatically, since local signup does not verify email addresses.
+    SocialAuthExceptionMiddleware shows the message on the login page.
+    """
+    if user:
+        return None
+    email = details.get("email")
+    if email and users_with_email(email).exists():
+        raise AuthException(backend, "This email is already registered. Please log in with your email and password.")
+    return None
@@ -0,0 +1,26 @@
+import math
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+
+def take_token(user_id, rate_per_minute=None, burst=None):
+    """
+    Per-user token bucket in the Django cache: `burst` messages at once, refilled at
+    `rate_per_minute`. Returns (allowed, retry_after_seconds).
+    Read-modify-write without a lock, so concurrent requests can occasionally both get the last token.
+    The limit is only global with a shared cache (REDIS_URL); on the LocMem fallback every process
+    keeps its own buckets, so a user gets up to the limit once per web/worker process.
+    """
+    rate = (rate_per_minute or settings.CHAT_RATE_LIMIT_PER_MINUTE) / 60.0
+    burst = burst or settings.CHAT_RATE_LIMIT_BURST
+    key = f"chat_bucket:{user_id}"
+    now = time.time()
+
+    tokens, updated = cache.get(key, (burst, now))
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens < 1:
+        cache.set(key, (tokens, now), timeout=int(burst / rate) + 1)
+        return False, max(1, math.ceil((1 - tokens) / rate))
+    cache.set(key, (tokens - 1, now), timeout=int(burst / rate) + 1)
+    return True, 0
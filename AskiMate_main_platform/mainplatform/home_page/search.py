@@ -0,0 +1,125 @@
+"""
+Full-text search over a user's ChatMessages.
+
+Postgres: home_page_chatmessage.search_vector (tsvector, GIN) and search_config are kept
+up to date by a trigger (migration 0014); the text search config comes from detected_language.
+SQLite (local): an external-content FTS5 table, home_page_chatmessage_fts, synced by triggers.
+Neither column is on the ChatMessage model, so normal queries never load them.
+Archived sessions (home_page.archive) have no ChatMessage rows and are not searched until they
+are restored, which happens when the session is opened.
+"""
+
+import uuid
+from django.core.cache import cache
+from django.db import connection
+from django.utils.dateparse import parse_datetime
+from django.utils.html import escape
+
+# detected_language (نام یا کد langdetect) → config متن‌کاوی Postgres؛ بقیه 'simple'
+SEARCH_CONFIGS = {
+    "english": "english", "en": "english",
+    "ar": "arabic", "da": "danish", "de": "german", "el": "greek", "es": "spanish",
+    "fi": "finnish", "fr": "french", "hu": "hungarian", "id": "indonesian", "it": "italian",
+    "nl": "dutch", "no": "norwegian", "pt": "portuguese", "ro": "romanian", "ru": "russian",
+    "sv": "swedish", "tr": "turkish",
+}
+
+HIGHLIGHT_START, HIGHLIGHT_STOP = "\x02", "\x03"
+HEADLINE_OPTIONS = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxWords=30, MinWords=10, MaxFragments=2"
+USER_CONFIGS_TIMEOUT = 600
+
+
+def render_highlight(text):
+    """HTML-escape a snippet, then turn the highlight markers into <mark> tags."""
+    return escape(text).replace(HIGHLIGHT_START, "<mark>").replace(HIGHLIGHT_STOP, "</mark>")
+
+
+def user_search_configs(user_id):
+    """Text search configs used by this user's messages (usually one or two)."""
+    key = f"chat_search_configs:{user_id}"
+    configs = cache.get(key)
+    if configs is None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT DISTINCT m.search_config FROM home_page_chatmessage m "
+                "JOIN home_page_conversationsession s ON s.id = m.session_id WHERE s.user_id = %s",
+                [user_id],
+            )
+            configs = [row[0] for row in cursor.fetchall() if row[0]]
+        cache.set(key, configs, USER_CONFIGS_TIMEOUT)
+    return configs
+
+
+def _postgres_search(user_id, query, limit, offset):
+    configs = [c for c in user_search_configs(user_id) if c in SEARCH_CONFIGS.values() or c == "simple"]
+    if not configs:
+        return []
+    # یک شاخه برای هر config تا tsquery ثابت باشد و GIN استفاده شود
+    branch = (
+        "SELECT m.id, m.session_id, m.search_config, m.timestamp, q.query, "
+        "ts_rank_cd(m.search_vector, q.query) AS rank "
+        "FROM home_page_chatmessage m "
+        "JOIN home_page_conversationsession s ON s.id = m.session_id, "
+        "websearch_to_tsquery(%s::regconfig, %s) AS q(query) "
+        "WHERE s.user_id = %s AND m.search_config = %s AND m.search_vector @@ q.query"
+    )
+    params = [HEADLINE_OPTIONS]
+    for config in configs:
+        params += [config, query, user_id, config]
+    params += [limit, offset]
+    sql = (
+        "SELECT p.id, m.sender, p.timestamp, s.session_id, "
+        "ts_headline(p.search_config::regconfig, m.message, p.query, %s) "
+        "FROM (" + " UNION ALL ".join([branch] * len(configs)) +
+        " ORDER BY rank DESC, timestamp DESC LIMIT %s OFFSET %s) p "
+        "JOIN home_page_chatmessage m ON m.id = p.id "
+        "JOIN home_page_conversationsession s ON s.id = p.session_id "
+        "ORDER BY p.rank DESC, p.timestamp DESC"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _sqlite_search(user_id, query, limit, offset):
+    # هر کلمه به‌صورت phrase تا syntax FTS5 از ورودی کاربر اجرا نشود
+    match = " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+    sql = (
+        "SELECT m.id, m.sender, m.timestamp, s.session_id, "
+        "snippet(home_page_chatmessage_fts, 0, %s, %s, '…', 24) "
+        "FROM home_page_chatmessage_fts "
+        "JOIN home_page_chatmessage m ON m.id = home_page_chatmessage_fts.rowid "
+        "JOIN home_page_conversationsession s ON s.id = m.session_id "
+        "WHERE home_page_chatmessage_fts MATCH %s AND s.user_id = %s "
+        "ORDER BY bm25(home_page_chatmessage_fts), m.timestamp DESC LIMIT %s OFFSET %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [HIGHLIGHT_START, HIGHLIGHT_STOP, match, user_id, limit, offset])
+        return cursor.fetchall()
+
+
+def search_messages(user, query, page=1, page_size=20):
+    """
+    Best matches first among `user`'s messages. Returns (results, has_next);
+    each result carries an HTML-safe `highlight` snippet.
+    """
+    query = query.strip()
+    if not query:
+        return [], False
+    offset = (page - 1) * page_size
+    backend = _postgres_search if connection.vendor == "postgresql" else _sqlite_search
+    # یک ردیف اضافه برای has_next بدون COUNT
+    rows = backend(user.id, query, page_size + 1, offset)
+
+    results = []
+    for message_id, sender, timestamp, session_id, snippet in rows[:page_size]:
+        if isinstance(timestamp, str):
+            timestamp = parse_datetime(timestamp)
+        results.append({
+            "message_id": message_id,
+            "session_id": uuid.UUID(str(session_id)),
+            "sender": sender,
+            "timestamp": timestamp,
+            "highlight": render_highlight(snippet or ""),
+        })
+    return results, len(rows) > page_size
@@ -0,0 +1,197 @@
+// Chat page behaviour (home_page/templates/home_page/chat.html), loaded with `defer`
+function toggleSidebar() {
+  const sidebar = document.getElementById("sidebar");
+  sidebar.classList.toggle("closed");
+  sidebar.classList.toggle("open");
+}
+
+function scrollChatToBottom() {
+  const chatContainer = document.getElementById("chat");
+  chatContainer.scrollTop = chatContainer.scrollHeight;
+}
+
+document.addEventListener("DOMContentLoaded", function() {
+  scrollChatToBottom();
+
+  const sidebarToggle = document.getElementById("sidebarToggle");
+  if (sidebarToggle) sidebarToggle.addEventListener("click", toggleSidebar);
+
+  const chatForm = document.getElementById("chatForm");
+  const chatContainer = document.getElementById("chat");
+
+  function appendMessage(text, sender) {
+    const msgDiv = document.createElement("div");
+    msgDiv.classList.add(sender === "user" ? "user-message" : "bot-message", "message");
+    msgDiv.innerHTML = `
+      <span class="message-text">${text}</span>
+      <div class="message-time">
+        ${new Date().toLocaleTimeString([], {hour: '2-digit', minute:'2-digit'})}
+      </div>`;
+    chatContainer.appendChild(msgDiv);
+    scrollChatToBottom();
+    return msgDiv;
+  }
+
+  // 429 from the platform's rate limit or a busy ai_app: show the server's message and when to retry
+  function rateLimitedReply(error, retryAfter) {
+    return retryAfter ? `[${error}. Try again in ${retryAfter}s.]` : `[${error}]`;
+  }
+
+  function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return Date.now().toString(36) + "-" + Math.random().toString(36).slice(2);
+  }
+
+  // the last send that got no reply: sending the same text again reuses its key, so if the server
+  // did store a reply it is replayed instead of running the turn a second time
+  let unanswered = null;
+
+  function idempotencyKeyFor(text) {
+    if (!unanswered || unanswered.text !== text) unanswered = { text: text, key: newIdempotencyKey() };
+    return unanswered.key;
+  }
+
+  // fetch rejects only when no response arrived; retry once with the same key
+  function postMessage(body, idempotencyKey, retries) {
+    return fetch(chatForm.action, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        "X-CSRFToken": document.querySelector("[name=csrfmiddlewaretoken]").value,
+        "Idempotency-Key": idempotencyKey
+      },
+      body: body
+    }).catch(err => {
+      if (retries <= 0) throw err;
+      return new Promise(resolve => setTimeout(resolve, 1000)).then(() => postMessage(body, idempotencyKey, retries - 1));
+    });
+  }
+
+  // async turn mode: the POST returns 202 + status_url; poll it, backing off up to 5 s, until the worker finishes
+  function waitForJob(statusUrl, delayMs) {
+    return new Promise(resolve => setTimeout(resolve, delayMs))
+      .then(() => fetch(statusUrl, { headers: { "Accept": "application/json" } }))
+      .then(res => {
+        if (!res.ok) throw new Error(`HTTP error! Status: ${res.status}`);
+        return res.json();
+      })
+      .then(data => (data.status === "pending" || data.status === "running")
+        ? waitForJob(statusUrl, Math.min(delayMs * 1.5, 5000))
+        : data);
+  }
+
+  let inFlight = false;
+  const sendButton = document.getElementById("sendButton");
+
+  function finishTurn() {
+    inFlight = false;
+    if (sendButton) sendButton.disabled = false;
+  }
+
+  // ===== WebSocket channel: streamed replies, falls back to fetch when the socket is down =====
+  const sessionId = chatContainer.dataset.sessionId;
+  const chatSocketUrl = sessionId ? `${location.protocol === "https:" ? "wss" : "ws"}://${location.host}/ws/chat/${sessionId}/` : null;
+  let chatSocket = null;
+  let streamingBubble = null;
+  let typingIndicator = null;
+
+  function setTyping(state) {
+    if (state && !typingIndicator) {
+      typingIndicator = document.createElement("div");
+      typingIndicator.className = "typing-indicator";
+      typingIndicator.innerHTML = '<div class="typing-dot"></div><div class="typing-dot"></div><div class="typing-dot"></div>';
+      chatContainer.appendChild(typingIndicator);
+      scrollChatToBottom();
+    } else if (!state && typingIndicator) {
+      typingIndicator.remove();
+      typingIndicator = null;
+    }
+  }
+
+  function connectChatSocket(retryDelay) {
+    if (!chatSocketUrl || !window.WebSocket) return;
+    chatSocket = new WebSocket(chatSocketUrl);
+    chatSocket.onopen = () => { retryDelay = 1000; };
+    chatSocket.onmessage = (e) => {
+      const data = JSON.parse(e.data);
+      if (data.type === "typing") {
+        setTyping(data.state);
+      } else if (data.type === "token") {
+        setTyping(false);
+        if (!streamingBubble) streamingBubble = appendMessage("", "bot");
+        streamingBubble.querySelector(".message-text").textContent += data.text;
+        scrollChatToBottom();
+      } else if (data.type === "done") {
+        setTyping(false);
+        if (data.detected_language) unanswered = null;
+        const reply = data.ai_reply || "[No reply from AI]";
+        if (streamingBubble) {
+          streamingBubble.querySelector(".message-text").textContent = reply;
+        } else {
+          appendMessage(reply, "bot");
+        }
+        streamingBubble = null;
+        finishTurn();
+      } else if (data.type === "error") {
+        appendMessage(rateLimitedReply(data.error, data.retry_after), "bot");
+        finishTurn();
+      }
+    };
+    chatSocket.onclose = () => {
+      chatSocket = null;
+      setTyping(false);
+      if (inFlight) {
+        appendMessage("[Error communicating with server]", "bot");
+        finishTurn();
+      }
+      setTimeout(() => connectChatSocket(Math.min(retryDelay * 2, 30000)), retryDelay);
+    };
+  }
+
+  connectChatSocket(1000);
+
+  if (chatForm) {
+    chatForm.addEventListener("submit", function(e) {
+      e.preventDefault();
+      const inputField = document.getElementById("userInput");
+      const userText = inputField.value.trim();
+      if (!userText || inFlight) return;
+
+      inFlight = true;
+      sendButton.disabled = true;
+      const idempotencyKey = idempotencyKeyFor(userText);
+
+      appendMessage(userText, "user");
+      inputField.value = "";
+
+      if (chatSocket && chatSocket.readyState === WebSocket.OPEN) {
+        chatSocket.send(JSON.stringify({ message: userText, idempotency_key: idempotencyKey }));
+        return;
+      }
+
+      postMessage(JSON.stringify({ message: userText, idempotency_key: idempotencyKey }), idempotencyKey, 1)
+      .then(res => {
+        if (res.status === 429) {
+          return res.json().then(data => ({
+            ai_reply: rateLimitedReply(data.error, data.retry_after || res.headers.get("Retry-After"))
+          }));
+        }
+        if (!res.ok) throw new Error(`HTTP error! Status: ${res.status}`);
+        return res.json().then(data => res.status === 202 ? waitForJob(data.status_url, (data.poll_after || 1) * 1000) : data);
+      })
+      .then(data => {
+        if (data.detected_language) unanswered = null;
+        if (data.ai_reply) {
+          appendMessage(data.ai_reply, "bot");
+        } else {
+          appendMessage("[No reply from AI]", "bot");
+        }
+      })
+      .catch(err => {
+        console.error("Error sending message:", err);
+        appendMessage("[Error communicating with server]", "bot");
+      })
+      .finally(finishTurn);
+    });
+  }
+});
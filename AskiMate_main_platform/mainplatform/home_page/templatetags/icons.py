@@ -0,0 +1,40 @@
+from functools import lru_cache
+from django import template
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+# Built by `manage.py build_icon_sprite` (only the glyphs the templates use)
+ICON_SPRITE = "icons/chat-icons.svg"
+FONT_AWESOME_CSS = "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css"
+
+
+@lru_cache(maxsize=None)
+def sprite_available():
+    return finders.find(ICON_SPRITE) is not None
+
+
+@register.simple_tag
+def icon(name, **attrs):
+    """
+    {% icon "trash" class="me-2" %} → an <i> holding an SVG from the sprite, so the existing
+    `li i` / `.toggle-btn` styles keep applying. Falls back to the Font Awesome font icon.
+    """
+    css_class = attrs.pop("class", "")
+    extra = format_html_join("", ' {}="{}"', attrs.items())
+    if sprite_available():
+        return format_html(
+            '<i class="icon {}"{}><svg aria-hidden="true"><use href="{}#{}"></use></svg></i>',
+            css_class, extra, static(ICON_SPRITE), name
+        )
+    return format_html('<i class="fas fa-{} {}"{}></i>', name, css_class, extra)
+
+
+@register.simple_tag
+def icon_stylesheet():
+    """The Font Awesome stylesheet, needed only when the sprite hasn't been built."""
+    if sprite_available():
+        return ""
+    return format_html('<link rel="stylesheet" href="{}" />', FONT_AWESOME_CSS)
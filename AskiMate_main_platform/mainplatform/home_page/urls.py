@@ -14,6 +14,9 @@ urlpatterns = [
     path('chat/', views.redirect_to_latest_chat, name='chatbot-view'),  # میره آخرین سشن
     path('chat/new/', views.create_new_session, name='chatbot-new'),    # ساخت سشن جدید و رفتن بهش
     path('chat/<uuid:session_id>/', views.chatbot_main, name='chatbot-main'),  # نمایش سشن
+    path('chat/jobs/<uuid:job_id>/', views.chat_job_status, name='chat-job'),  # وضعیت جواب async (poll)
+    path('chat/search/', views.chat_search, name='chat-search'),  # جستجو در پیام‌های کاربر
+    path('chat/export/', views.chat_export, name='chat-export'),  # دانلود همه‌ی گفتگوها (jsonl/csv)
 
     # حذف سشن
     path('chat/delete/<uuid:session_id>/', views.delete_session, name='delete-session'),
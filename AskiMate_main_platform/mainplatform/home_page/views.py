@@ -1,3 +1,4 @@
+import hashlib
 import logging
 import os
 import requests
@@ -10,9 +11,21 @@ from django.core.mail import send_mail
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
-from .models import ConversationSession, ChatMessage
+from django.views.decorators.http import condition
+from django.db import IntegrityError
+from django.db.models import Count, Max
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from .models import ConversationSession, ChatMessage, ChatJob
+from .ai_turns import prewarm_ai_app, run_ai_turn
+from .accounts import users_with_email
+from .archive import delete_archive, restore_session
+from .search import search_messages
+from .export import EXPORT_FORMATS, aiter_chunks, export_conversations
+from .ratelimit import take_token
+from .analytics import record_ai_error
 import json
 import requests
 from django.contrib.auth.decorators import login_required
@@ -30,7 +43,7 @@ def main_page(request):
         email = request.POST.get('email', '').strip().lower()
 
         if full_name and email:
-            if User.objects.filter(email=email).exists():
+            if users_with_email(email).exists():
                 messages.error(request, "You have already joined the waiting list before.")
                 return redirect('main_page')
 
@@ -112,7 +125,7 @@ def signup_view(request):
             error = 'All fields are required.'
         elif User.objects.filter(username=username).exists():
             error = 'Username already exists.'
-        elif User.objects.filter(email=email).exists():
+        elif users_with_email(email).exists():
             error = 'Email already registered.'
         else:
             try:
@@ -142,7 +155,9 @@ def email_login_view(request):
         if not email:
             messages.error(request, 'Please enter your email.')
             return redirect('custom_login')
-        request.session['login_email'] = email
+        # فقط اگر عوض شده بنویس (هر تغییر سشن یعنی یک write)
+        if request.session.get('login_email') != email:
+            request.session['login_email'] = email
         return redirect('password_login')
     return redirect('custom_login')
 
@@ -158,13 +173,17 @@ def password_login_view(request):
         if not password:
             error = 'Please enter your password.'
         else:
-            user = User.objects.filter(email=email).first()
+            # از ایندکس auth_user_email_lower_uniq استفاده می‌کند
+            user = users_with_email(email).only('id', 'username').first()
             if not user:
                 error = 'No user found with this email.'
             else:
                 auth_user = authenticate(request, username=user.username, password=password)
                 if auth_user is not None:
                     login(request, auth_user)
+                    # login() سشن را در هر حال ذخیره می‌کند؛ login_email دیگر لازم نیست
+                    request.session.pop('login_email', None)
+                    prewarm_ai_app()
                     messages.success(request, f'Welcome back, {user.username}!')
 
                     last_session = ConversationSession.objects.filter(user=user).order_by('-created_at').first()
@@ -213,16 +232,109 @@ def redirect_to_latest_chat(request):
     return redirect('chatbot-new')
 
 
-AI_APP_URL = "https://askimate-ai-app.onrender.com/chat"  # آدرس سرویس FastAPI
+def idempotent_reply(session, idempotency_key):
+    """
+    Response for a send whose idempotency key was already seen in this session:
+    the stored bot reply if the first request finished, 409 while it is still running,
+    or None if the key is new.
+    """
+    stored = {
+        m.sender: m
+        for m in ChatMessage.objects.filter(session=session, idempotency_key=idempotency_key)
+    }
+    if "bot" in stored:
+        return JsonResponse({
+            "ai_reply": stored["bot"].message,
+            "user_message": stored["user"].message if "user" in stored else "",
+            "detected_language": stored["bot"].detected_language,
+            "replayed": True
+        })
+    if "user" in stored:
+        job = ChatJob.objects.filter(user_message=stored["user"]).first()
+        if job:
+            return job_accepted_response(job)
+        return JsonResponse({"error": "This message is already being processed"}, status=409)
+    return None
+
+
+def job_payload(job):
+    data = {"job_id": str(job.job_id), "status": job.status, "ai_reply": None, "detected_language": None}
+    if job.status in ("pending", "running"):
+        # کلاینت خودش با backoff دوباره می‌پرسد؛ سرور منتظر نمی‌ماند
+        data["poll_after"] = settings.CHAT_JOB_POLL_INTERVAL
+    elif job.status == "done" and job.bot_message:
+        data["ai_reply"] = job.bot_message.message
+        data["detected_language"] = job.bot_message.detected_language
+    elif job.status == "failed":
+        data["ai_reply"] = f"[Error] {job.error}"
+    return data
+
+
+def job_accepted_response(job):
+    data = job_payload(job)
+    data["status_url"] = reverse('chat-job', kwargs={'job_id': job.job_id})
+    return JsonResponse(data, status=202)
+
+
+def chat_page_state(request, session_id):
+    """
+    Versions of the data behind the chat page, computed once per request:
+    messages_version changes when a message is added to or removed from the session,
+    sidebar_version when one of the user's sessions is.
+    """
+    if not hasattr(request, "_chat_page_state"):
+        msgs = ChatMessage.objects.filter(
+            session__session_id=session_id, session__user=request.user
+        ).aggregate(last=Max("timestamp"), n=Count("id"))
+        sessions = ConversationSession.objects.filter(
+            user=request.user
+        ).aggregate(last=Max("created_at"), n=Count("id"))
+        request._chat_page_state = {
+            "messages_version": f"{msgs['n']}-{msgs['last'].timestamp() if msgs['last'] else 0}",
+            "sidebar_version": f"{sessions['n']}-{sessions['last'].timestamp() if sessions['last'] else 0}",
+            "last_modified": max(filter(None, [msgs["last"], sessions["last"]]), default=None),
+        }
+    return request._chat_page_state
+
+
+def chat_page_etag(request, session_id):
+    # فقط برای GET؛ POST همیشه اجرا می‌شود
+    if request.method not in ("GET", "HEAD") or not request.user.is_authenticated:
+        return None
+    state = chat_page_state(request, session_id)
+    # کلید سشن در ETag است چون صفحه CSRF token دارد و بعد از لاگین عوض می‌شود
+    raw = "|".join([
+        str(session_id), state["messages_version"], state["sidebar_version"],
+        request.session.session_key or "", settings.RELEASE_VERSION,
+    ])
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def chat_page_last_modified(request, session_id):
+    if request.method not in ("GET", "HEAD") or not request.user.is_authenticated:
+        return None
+    return chat_page_state(request, session_id)["last_modified"]
+
+
+def rate_limited_response(retry_after):
+    response = JsonResponse({"error": "Too many messages, please slow down", "retry_after": retry_after}, status=429)
+    response["Retry-After"] = str(retry_after)
+    return response
+
 
 @login_required
 @csrf_exempt  # یا حذف و استفاده از CSRF token هدر
+@condition(etag_func=chat_page_etag, last_modified_func=chat_page_last_modified)
+@cache_control(private=True, no_cache=True)
 def chatbot_main(request, session_id):
     active_session = get_object_or_404(
         ConversationSession,
         session_id=session_id,
         user=request.user
     )
+    # سشن بایگانی‌شده: اول پیام‌ها را برگردان
+    if active_session.archived_at:
+        restore_session(active_session)
 
     if request.method == "POST":
         try:
@@ -231,54 +343,59 @@ def chatbot_main(request, session_id):
             return JsonResponse({"error": "Invalid JSON"}, status=400)
 
         user_text = body_data.get("message", "").strip()
+        idempotency_key = (request.headers.get("Idempotency-Key") or body_data.get("idempotency_key") or "").strip()[:64] or None
         ai_reply = None
         detected_language = None
 
         if not user_text:
             return JsonResponse({"error": "Empty message"}, status=400)
 
-        # ثبت پیام کاربر
-        user_message = ChatMessage.objects.create(
-            session=active_session,
-            sender="user",
-            message=user_text,
-            detected_language="Unknown",
-            original_message=user_text
-        )
-
-        # ساخت history برای AI
-        history = [
-            {"role": "user" if m.sender == "user" else "bot", "content": m.message}
-            for m in ChatMessage.objects.filter(session=active_session).order_by("timestamp")
-        ]
-        payload = {
-            "session_id": str(active_session.session_id),
-            "message": user_text,
-            "history": history
-        }
-
-        try:
-            resp = requests.post(AI_APP_URL, json=payload, timeout=120)
-            resp.raise_for_status()
-            data = resp.json()
-
-            ai_reply = data.get("answer", "No reply")
-            detected_language = data.get("detected_language", "English")
+        # ارسال تکراری (دابل‌کلیک یا retry) → همان جواب قبلی
+        if idempotency_key:
+            replayed = idempotent_reply(active_session, idempotency_key)
+            if replayed is not None:
+                return replayed
 
-            # آپدیت پیام کاربر با زبان شناسایی‌شده
-            user_message.detected_language = detected_language
-            user_message.save()
+        # محدودیت نرخ برای هر کاربر (token bucket)
+        allowed, retry_after = take_token(request.user.id)
+        if not allowed:
+            return rate_limited_response(retry_after)
 
-            # ثبت جواب AI
-            ChatMessage.objects.create(
+        # ثبت پیام کاربر
+        try:
+            user_message = ChatMessage.objects.create(
                 session=active_session,
-                sender="bot",
-                message=ai_reply,
-                detected_language=detected_language,
-                original_message=ai_reply
+                sender="user",
+                message=user_text,
+                detected_language="Unknown",
+                idempotency_key=idempotency_key
             )
+        except IntegrityError:
+            # درخواست هم‌زمان با همین کلید زودتر ثبت شد
+            replayed = idempotent_reply(active_session, idempotency_key)
+            if replayed is None:
+                # آن درخواست در این فاصله شکست خورد و پیامش را پاک کرد
+                return JsonResponse({"error": "This message could not be sent, please send it again"}, status=409)
+            return replayed
+
+        # حالت async: صف کردن و برگرداندن 202، جواب را worker می‌نویسد
+        if settings.CHAT_ASYNC_TURNS:
+            job = ChatJob.objects.create(session=active_session, user_message=user_message)
+            return job_accepted_response(job)
+
+        try:
+            bot_message = run_ai_turn(active_session, user_message, idempotency_key)
+            ai_reply = bot_message.message
+            detected_language = bot_message.detected_language
         except Exception as e:
+            if isinstance(e, requests.HTTPError) and e.response is not None and e.response.status_code == 429:
+                # ai_app شلوغ است: پیام کاربر را پاک کن تا retry تکراری نسازد
+                user_message.delete()
+                return rate_limited_response(int(e.response.headers.get("Retry-After", 1)))
             ai_reply = f"[Error] {str(e)}"
+            record_ai_error()
+            # پیام بی‌جواب را پاک کن تا retry با همین کلید دوباره ثبتش کند، نه نسخه‌ی دوم
+            user_message.delete()
 
         return JsonResponse({
             "ai_reply": ai_reply,
@@ -286,30 +403,89 @@ def chatbot_main(request, session_id):
             "detected_language": detected_language
         })
 
-    # GET → لود صفحه چت
+    # GET → لود صفحه چت (و بیدار کردن ai_app تا کاربر تایپ کند)
+    prewarm_ai_app()
     sessions = ConversationSession.objects.filter(user=request.user).order_by("-created_at")
     messages_qs = ChatMessage.objects.filter(session=active_session).order_by("timestamp")
+    # کوئری‌ها lazy هستند؛ اگر fragment در کش باشد اصلاً اجرا نمی‌شوند
+    state = chat_page_state(request, session_id)
     return render(request, "home_page/chat.html", {
         "sessions": sessions,
         "active_session": active_session,
-        "messages": messages_qs
+        "messages": messages_qs,
+        "sidebar_version": state["sidebar_version"],
+        "messages_version": state["messages_version"]
     })
 
 
-@csrf_exempt
-def create_new_session(request):
-    user = request.user
-    # ایجاد سشن جدید با زبان پیش‌فرض
-    session = ConversationSession.objects.create(
+@login_required
+def chat_job_status(request, job_id):
+    """Current state of a queued AI turn; returns at once, the client polls again after `poll_after` seconds."""
+    job = get_object_or_404(ChatJob.objects.select_related("bot_message"), job_id=job_id, session__user=request.user)
+    return JsonResponse(job_payload(job))
+
+
+@login_required
+def chat_search(request):
+    """
+    Full-text search over the user's own messages: GET ?q=...&page=N, 20 results per page.
+    Archived sessions are not searched; the response says how many there are.
+    """
+    query = request.GET.get("q", "").strip()[:200]
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+    results, has_next = search_messages(request.user, query, page=page)
+    for r in results:
+        r["url"] = reverse('chatbot-main', kwargs={'session_id': r["session_id"]})
+    data = {"query": query, "page": page, "has_next": has_next, "results": results}
+    archived = ConversationSession.objects.filter(user=request.user, archived_at__isnull=False).count()
+    if archived:
+        data["archived_sessions"] = archived
+        data["notice"] = f"{archived} archived conversation(s) are not searched. Open one to restore it and include it in search."
+    return JsonResponse(data)
+
+
+@login_required
+def chat_export(request):
+    """Download all of the user's conversations as ?format=jsonl (default) or csv, streamed."""
+    fmt = request.GET.get("format", "jsonl")
+    if fmt not in EXPORT_FORMATS:
+        return JsonResponse({"error": "Unsupported format"}, status=400)
+    lines = export_conversations(request.user, fmt)
+    response = StreamingHttpResponse(
+        aiter_chunks(lines) if isinstance(request, ASGIRequest) else lines,
+        content_type=EXPORT_FORMATS[fmt]
+    )
+    response["Content-Disposition"] = f'attachment; filename="askimate-conversations.{fmt}"'
+    return response
+
+
+def new_conversation_session(user):
+    """New session that starts with the user's last confirmed language, sent to ai_app as a hint from its first turn."""
+    last_language = (
+        ConversationSession.objects.filter(user=user, language_confirmed=True)
+        .order_by('-created_at').values_list('user_language', flat=True).first()
+    )
+    return ConversationSession.objects.create(
         user=user,
-        user_language='English'  # زبان پیش‌فرض
+        user_language=last_language or 'English',  # زبان پیش‌فرض
+        language_confirmed=last_language is not None
     )
+
+
+@csrf_exempt
+def create_new_session(request):
+    # ایجاد سشن جدید با زبان آخرین سشن تأییدشده (یا پیش‌فرض)
+    session = new_conversation_session(request.user)
     return redirect('chatbot-main', session_id=session.session_id)
 
 
 @csrf_exempt
 def delete_session(request, session_id):
     session = get_object_or_404(ConversationSession, user=request.user, session_id=session_id)
+    delete_archive(session)
     session.delete()
 
     # بعد حذف، به آخرین جلسه موجود برگرد
@@ -322,11 +498,8 @@ def delete_session(request, session_id):
 
 @csrf_exempt
 def chatbot_new(request):
-    # ایجاد جلسه جدید با زبان پیش‌فرض
-    new_session = ConversationSession.objects.create(
-        user=request.user,
-        user_language='English'  # زبان پیش‌فرض
-    )
+    # ایجاد جلسه جدید با زبان آخرین سشن تأییدشده (یا پیش‌فرض)
+    new_session = new_conversation_session(request.user)
 
     return redirect('chatbot-main', session_id=new_session.session_id)
 